@@ -1,191 +1,302 @@
-from flask import Flask, request
-from linebot import LineBotApi, WebhookHandler
-from linebot.models import MessageEvent, TextMessage, TextSendMessage
-import json
-from datetime import datetime
-from zoneinfo import ZoneInfo
+from flask import Flask, request, abort, jsonify, g
+from linebot import WebhookHandler
+from linebot.exceptions import InvalidSignatureError, LineBotApiError
+from linebot.models import MessageEvent, TextMessage, TextSendMessage, FollowEvent, UnfollowEvent
 import os
-import gspread
 import re
 import random
-import unicodedata
-from oauth2client.service_account import ServiceAccountCredentials
-from io import StringIO
-from weekly_report import fetch_weekly_summary, generate_summary_comment, create_weekly_report_message, get_week_range, record_weekly_report
-from google_sheets_util import get_sheet, get_emotion_sheet
-from library import get_jst_date, get_jst_time, load_tasks
-from review_reminder import REVIEW_DAYS, get_review_targets, record_review_reminder
+import threading
+import time
+from weekly_report import fetch_weekly_summary, generate_summary_comment, precompute_summary_comment, create_weekly_report_message, get_week_range, record_weekly_report, record_weekly_reports
+from storage import STORAGE_BACKEND, get_sqlite_storage, start_exporter
+from google_sheets_util import get_sheets_manager
+from sheet_mirror import get_completion_mirror, get_mirror, invalidate_mirrors
+from library import get_jst_date, get_jst_time, debug_log, is_debug_enabled, normalize, DEFAULT_USER_ID, record_user_id, LazyObject
+from task_catalog import get_catalog
+from daily_rollup import get_rollup_store
+from text_normalizer import clean_text, legacy_normalize, remove_emojis
+from pending_view import PendingTaskView
+from review_reminder import get_review_targets, record_review_reminder, review_schedule
+from user_registry import get_user_registry
+from push_scheduler import PushScheduler
+from scheduler import SCHEDULER_ENABLED, Scheduler
+from webhook_worker import EventWorkerPool
+from event_dedup import event_id_of, get_seen_events
+from planner import get_study_budgets
+from pipeline import Pipeline
+from line_client import create_line_bot_api
+from trend_report import build_monthly_trend_message, build_range_trend_message
+from write_buffer import WRITE_BUFFER_ENABLED, get_write_buffer
+from metrics import REGISTRY, COMMAND_LATENCY, ROUTE_LATENCY, Counter, Gauge, InstrumentedProxy
+from sheets_quota import get_quota_guard
 
 app = Flask(__name__)
 
 # LINE Botの設定（トークンは環境変数または直接記述でも可）
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN", "YOUR_ACCESS_TOKEN")
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+# LINE APIの呼び出しはメソッドごとに件数・レイテンシを計測する（クライアントは初回の呼び出し時に作成）
+# HTTPセッションはコネクションプールごと使い回す（並列のPushでも接続を張り直さない）
+line_bot_api = InstrumentedProxy(LazyObject(lambda: create_line_bot_api(LINE_CHANNEL_ACCESS_TOKEN)), "line", "messaging_api")
 handler = WebhookHandler(os.getenv("LINE_CHANNEL_SECRET", "YOUR_SECRET"))
 
-# ユーザーID（Push先：自分のID）
-USER_ID = "U7f366710ac3959bbaa4041a5c6a2dc5c" # ←自分のLINE ID
-
-# 文字列の正規化
-def normalize(text):
-    if not text:
-        return ''
-    text = unicodedata.normalize("NFKC", text)
-    text = re.sub(r'[\u200B-\u200D\uFEFFuFE0F]', '', text)
-    text = re.sub(r'[\x00-\x1F\x7F]', '', text)
-    text = re.sub(r'\s', '', text)
-    return text
-
-# 日付の形式に対応
-def parse_deadline(date_str):
-    """ハイフン・スラッシュどちらの形式にも対応"""
-    for fmt in ("%Y-%m-%d", "%Y/%m/%d"):
-        try:
-            return datetime.strptime(date_str, fmt).date()
-        except ValueError:
-            continue
-    raise ValueError(f"Unsupported date format: {date_str}")
-
-# 「第◯回」の抽出
-def extract_lesson_number(title):
-    """タイトルから「第◯回」の数字を抽出"""
-    match = re.search(r"第(\d+)回", title)
-    return int(match.group(1)) if match else 9999 #該当なしは後回し
-
-# 絵文字を除去
-def remove_emojis(text):
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F300-\U0001F64F" # 顔文字・自然・手など
-        "\U0001F680-\U0001F6FF"  # 乗り物・地図記号
-        "\u2600-\u26FF"          # その他の記号
-        "\u2700-\u27BF"          # その他の記号
-        "\uFE0F"                 # 絵文字用バリアントセレクタ
-        "]+", flags=re.UNICODE
-    )
-    return emoji_pattern.sub("", text).strip()
+# ユーザーID（UserId列のない既存の記録の持ち主。環境変数 LINE_USER_ID で変更可）
+USER_ID = DEFAULT_USER_ID
+
+# 登録ユーザーへのPush配信（multicastのまとめ・レート制限・再送）
+push_scheduler = PushScheduler(line_bot_api)
+
+# gunicornのpreload時は、バックグラウンドのスレッドをfork後の各ワーカーで起動する
+PRELOAD_MODE = os.getenv("UNIQUEST_PRELOAD", "0") == "1"
+
+# 1にするとWebhookを即時応答し、イベントはワーカープールで処理する
+WEBHOOK_ASYNC = os.getenv("WEBHOOK_ASYNC", "0") == "1"
+
+# 今日のクエストの選び方（random: 各科目の先頭からランダム、planner: 学習時間の予算で計画）
+QUEST_MODE = os.getenv("QUEST_MODE", "random")
+
+# 達成記録のインデックス（正規化済みキー）
+COMPLETION_INDEX = "date_subject_title"
+COMPLETED_TASK_INDEX = "subject_title"
+
+# 正規化の修正前（「第10回」が「第1回」になっていた頃）の達成記録も旧キーで照合する移行期間の設定
+# この日付（YYYY-MM-DD）より前の行だけを旧キーの記録とみなす。空なら全行、off なら照合しない
+LEGACY_KEYS_BEFORE = os.getenv("LEGACY_KEYS_BEFORE", "")
+
+def _completion_key(row):
+    return (record_user_id(row), normalize(row["Date"]), normalize(row["Subject"]), normalize(row["Title"]))
+
+def _completed_task_key(row):
+    key = (record_user_id(row), normalize(row["Subject"]), normalize(row["Title"]))
+    if is_debug_enabled():
+        debug_log(f"Subject raw: {repr(row['Subject'])} → normalized: {key[1]}")
+    return key
+
+get_completion_mirror().add_index(COMPLETION_INDEX, _completion_key)
+get_completion_mirror().add_index(COMPLETED_TASK_INDEX, _completed_task_key)
+
+# ユーザーごとの未達成タスクのビュー（「クエスト」「合計」で共有）
+pending_views = {}
+pending_views_lock = threading.Lock()
+
+def get_pending_view(user_id=USER_ID):
+    with pending_views_lock:
+        view = pending_views.get(user_id)
+        if view is None:
+            def key_func(row):
+                if record_user_id(row) != user_id:
+                    return None
+                return _completed_task_key(row)[1:]
+
+            view = PendingTaskView(get_catalog(user_id), get_completion_mirror(),
+                                   lambda: _completed_keys(user_id), key_func)
+            pending_views[user_id] = view
+        return view
+
+def _completed_keys(user_id):
+    keys = get_completion_mirror().index_keys(COMPLETED_TASK_INDEX)
+    completed = {key[1:] for key in keys if key[0] == user_id}
+    if LEGACY_KEYS_BEFORE != "off":
+        completed |= _legacy_completed_keys(user_id, completed)
+    return completed
+
+def _legacy_completed_keys(user_id, completed):
+    """旧キーで記録された達成を、いまのキーに読み替える
+
+    旧キーでは「第1回」と「第10回」が同じキーになり、どちらか一方の記録で両方が達成扱いだった
+    （クエストには若い回から出るので、記録が1件なら第1回）。旧キーが同じエントリを
+    第◯回の若い順に並べ、旧キーの記録の件数（日付の異なる行の数）だけ達成済みとみなす。
+    """
+    legacy_counts = {}
+    for uid, date, subject, title in get_completion_mirror().index_keys(COMPLETION_INDEX):
+        if uid == user_id and (not LEGACY_KEYS_BEFORE or date < LEGACY_KEYS_BEFORE):
+            legacy_counts[(subject, title)] = legacy_counts.get((subject, title), 0) + 1
+    if not legacy_counts:
+        return set()
+
+    groups = {}
+    for entry in get_catalog(user_id).entries():
+        legacy_key = (legacy_normalize(entry.subject), legacy_normalize(entry.title))
+        if legacy_key in legacy_counts:
+            groups.setdefault(legacy_key, []).append(entry)
+
+    matched = set()
+    for legacy_key, entries in groups.items():
+        keys = {(entry.subject_key, entry.title_key) for entry in entries}
+        if keys == {legacy_key}:
+            continue # 修正の影響を受けないキー
+        remaining = legacy_counts[legacy_key]
+        for entry in sorted(entries, key=lambda entry: (entry.lesson, entry.deadline)):
+            key = (entry.subject_key, entry.title_key)
+            if key != legacy_key and key in completed:
+                continue # 修正後に、いまのキーで記録済み
+            if remaining <= 0:
+                break
+            if key not in matched:
+                matched.add(key)
+                remaining -= 1
+    return matched
 
 # 達成済みタスクの取得関数
-def get_completed_tasks():
+def get_completed_tasks(user_id=USER_ID):
     try:
-        sheet = get_sheet()
-        records = sheet.get_all_records()
-        completed = set()
-        for row in records:
-            print(f"[DEBUG] 読み込んだ行: {row}")
-            completed.add((normalize(row["Subject"]), normalize(row["Title"])))
+        completed = _completed_keys(user_id)
+        debug_log(f"達成済みタスク: {len(completed)}件")
         return completed
     except Exception as e:
         print(f"❌️ 達成済みタスクの取得失敗: {e}")
         return set()
 
 # 今日のクエストを抽出
-def get_todays_quests(task_list, max_tasks=3):
-    today = datetime.now().date()
-    completed = get_completed_tasks()
-
-    # 未達成かつ締切が今日以降のタスクを抽出
-    filtered = []
-    for task in task_list:
+def get_todays_quests(max_tasks=3, user_id=USER_ID):
+    if QUEST_MODE == "planner":
         try:
-            deadline = parse_deadline(task["deadline"])
-            if deadline >= today and (task["subject"], task["title"]) not in completed:
-                filtered.append(task)
+            plan, _ = get_todays_plan(user_id)
+            return [entry.task for entry in plan]
         except Exception as e:
-            print(f"❌️ タスクフィルタ中エラー: {e}")
-            continue
-
-    # 各科目ごとに最も若い回をピックアップ
-    subject_to_tasks = {}
-    for task in filtered:
-        subject = task["subject"]
-        current = subject_to_tasks.get(subject)
+            print(f"❌️ 今日の計画の作成に失敗: {e}")
+            return []
 
-        if current is None or extract_lesson_number(task["title"]) < extract_lesson_number(current["title"]):
-            subject_to_tasks[subject] = task
+    # 各科目で最も若い回（未達成かつ締切が今日以降）
+    try:
+        selected = [entry.task for entry in get_pending_view(user_id).heads()]
+    except Exception as e:
+        print(f"❌️ 未達成タスクの取得失敗: {e}")
+        return []
 
     # ピックアップされたものをランダムに並べ、上から3件
-    selected = list(subject_to_tasks.values())
     random.shuffle(selected)
     return selected[:max_tasks]
 
+# 学習時間の予算に収まる今日の計画
+def get_todays_plan(user_id=USER_ID):
+    budget = get_study_budgets().get(user_id)
+    return get_pending_view(user_id).plan(budget), budget
+
+def build_plan_message(user_id=USER_ID):
+    plan, budget = get_todays_plan(user_id)
+    if not plan:
+        return f"🎯 今日の計画に入るタスクはありません！（学習時間：{budget:g}時間）"
+
+    message = f"🗓️ 今日の計画（学習時間：{budget:g}時間）\n\n"
+    for entry in plan:
+        message += (
+            f"📘 {entry.subject}：{entry.title}\n"
+            f"⏱️ {entry.hours:g}時間 ／ 締切：{entry.task['deadline']}\n\n"
+        )
+    message += f"合計：{sum(entry.hours for entry in plan):g}時間"
+    return message
+
+def parse_study_hours(text):
+    """「1.5」「1.5時間」「90分」を時間に変換"""
+    value = normalize(text).replace("時間", "")
+    if value.endswith("分"):
+        return float(value[:-1]) / 60
+    return float(value)
+
 # 達成記録をGoogle Sheetsに保存
-def record_task_completion(subject, title):
+def record_task_completion(subject, title, user_id=USER_ID):
     date = get_jst_date()
     timestamp = get_jst_time()
     subject = normalize(subject)
     title = normalize(title)
 
     try:
-        sheet = get_sheet()
+        mirror = get_completion_mirror()
 
         # 重複チェック（同じ日付・科目・タイトルが既にあるか）
-        records = sheet.get_all_records()
-        for row in records:
-            if normalize(row["Date"]) == date and normalize(row["Subject"]) == subject and normalize(row["Title"]) == title:
-                return False # 重複
-        for row in records:
-            subj = normalize(row["Subject"])
-            print(f"[DEBUG] Subject raw: {repr(row['Subject'])} → normalized: {subj}")
+        if mirror.contains(COMPLETION_INDEX, (user_id, date, subject, title)):
+            debug_log(f"重複のため記録しません: {date} {subject} {title}")
+            return False # 重複
+
         # 新規行の追加
-        subject = normalize(subject)
-        title = normalize(title)
-        sheet.append_row([date, subject, title, timestamp])
-        return True
+        mirror.append_row([date, subject, title, timestamp, user_id])
     except Exception as e:
         print(f"❌️ Google Sheetsへの書き込み失敗: {e}")
         return False
 
+    record_rollup(lambda store: store.record_completion(date, subject, user_id))
+    return True
+
+# 日別集計の更新（失敗しても記録自体は成功扱い）
+def record_rollup(update):
+    try:
+        update(get_rollup_store())
+    except Exception as e:
+        print(f"⚠️ 日別集計の更新に失敗: {e}")
+
 # 感情ログを保存
-def record_emotion_log(emoji, focus, comment):
-    sheet = get_emotion_sheet()
+def record_emotion_log(emoji, focus, comment, user_id=USER_ID):
     today = get_jst_date()
 
-    sheet.append_row([today, emoji, focus, comment])
+    # ミラー経由で書き込み、傾向レポートの時系列にもすぐ反映する
+    get_mirror("感情ログ").append_row([today, emoji, focus, comment, user_id])
+    record_rollup(lambda store: store.record_emotion(today, emoji, focus, user_id))
     return True
 
 # 未達成タスクの総数
-def get_tasks_total():
-    today = datetime.now().date()
-    completed = get_completed_tasks()
-    task_list = load_tasks()
-
-    # 締切が今日以降かつ未達成のタスクを抽出
-    filtered = []
-    for task in task_list:
-        try:
+def get_tasks_total(user_id=USER_ID):
+    return get_pending_view(user_id).total()
 
-            deadline = parse_deadline(task["deadline"])
-            subject = normalize(task["subject"])
-            title = normalize(task["title"])
-
-            if deadline >= today and (subject, title) not in completed:
-                filtered.append(task)
+# 週次レポート（送信と記録は互いに依存しないので同時に行う）
+def send_weekly_report(user_id=USER_ID):
+    with Pipeline("weekly_report") as pipeline:
+        try:
+            with pipeline.stage("summary"):
+                summary = fetch_weekly_summary(user_id)
+            with pipeline.stage("comment"):
+                comment = generate_summary_comment(summary)
+            message = create_weekly_report_message(summary, comment)
+
+            archive = pipeline.submit("archive", record_weekly_report, summary, comment, user_id)
+            try:
+                with pipeline.stage("push"):
+                    line_bot_api.push_message(user_id, TextSendMessage(text=message))
+            finally:
+                archive.result()
+            print("✅️ 週次レポートを送信しました。")
         except Exception as e:
-            print(f"❌️ タスクフィルタ中エラー: {e}")
-            continue
-    # 抽出されたタスクの総数をカウント
-    total = len(filtered)
-    # print(filtered)
-    # print(completed)
-    return total
-
-# 週次レポート
-def send_weekly_report():
-    try:
-        summary = fetch_weekly_summary()
-        comment = generate_summary_comment(summary)
-        message = create_weekly_report_message(summary, comment)
+            print("❌️ 週次レポート送信に失敗：", e)
+
+# 全ユーザーの週次レポートを作成
+def prepare_weekly_reports():
+    with Pipeline("weekly_reports_prepare") as pipeline:
+        # 先に全員のサマリーを集計してコメント生成を一斉に始め、生成を並列に進める
+        summaries = {}
+        with pipeline.stage("summary"):
+            for user_id in get_user_registry().active_users():
+                try:
+                    summaries[user_id] = precompute_summary_comment(user_id)
+                except Exception as e:
+                    print(f"❌️ 週次レポートの作成に失敗（{user_id}）：{e}")
+
+        reports = {}
+        with pipeline.stage("comment"):
+            for user_id, summary in summaries.items():
+                comment = generate_summary_comment(summary)
+                reports[user_id] = (summary, comment, create_weekly_report_message(summary, comment))
+    return reports
+
+# 全ユーザーへの週次レポート（作成済みならそれを送る）
+def send_weekly_reports(reports=None):
+    with Pipeline("weekly_reports") as pipeline:
+        if reports is None:
+            with pipeline.stage("prepare"):
+                reports = prepare_weekly_reports()
+
+        messages = {user_id: message for user_id, (_, _, message) in reports.items()}
+        start_date, _ = get_week_range()
+
+        # シートへの記録とPushを同時に行う
+        archive = pipeline.submit("archive", record_weekly_reports, reports)
+        try:
+            with pipeline.stage("push"):
+                return push_scheduler.send(messages, send_key=f"weekly_report:{start_date}")
+        finally:
+            archive.result()
 
-        record_weekly_report(summary, comment)
-        line_bot_api.push_message(USER_ID, TextSendMessage(text=message))
-        print("✅️ 週次レポートを送信しました。")
-    except Exception as e:
-        print("❌️ 週次レポート送信に失敗：", e)
-
-# 復習リマインド
-def send_review_push():
-    review_targets = get_review_targets()
+# 復習リマインドのメッセージ
+def build_review_message(user_id=USER_ID):
+    review_targets = get_review_targets(user_id)
 
     if not review_targets:
         message = "📘 今日の復習対象はありません！ゆっくり休もう✨️"
@@ -196,21 +307,30 @@ def send_review_push():
                 f"📘 {task['subject']} : {task['title']}\n"
                 f"📅 学習日：{task['date']}({task['review_stage']}回目の復習)\n\n"
             )
+    return message
 
-    try:
-        line_bot_api.push_message(
-            USER_ID,
-            TextSendMessage(text=message)
-        )
+def prepare_review_push():
+    with Pipeline("review_reminder_prepare") as pipeline:
+        # 達成記録・復習記録のミラーを並列に同期してから、各ユーザーの文面を作る
+        pipeline.gather(completions=get_completion_mirror().refresh, reviews=get_mirror("復習記録").refresh)
+        with pipeline.stage("messages"):
+            return {user_id: build_review_message(user_id) for user_id in get_user_registry().active_users()}
+
+# 復習リマインド
+def send_review_push(messages=None):
+    with Pipeline("review_reminder") as pipeline:
+        if messages is None:
+            with pipeline.stage("prepare"):
+                messages = prepare_review_push()
+        with pipeline.stage("push"):
+            result = push_scheduler.send(messages, send_key=f"review_reminder:{get_jst_date()}")
+    if result["failed"] == 0:
         print("✅️ 復習Push送信成功！")
-    except Exception as e:
-        print(f"❌️ Push通知送信失敗：{e}")
+    return result
 
-# Push通知を送るためのエンドポイント（Render上で手動アクセス or スケジューラー用）
-@app.route("/push_daily_quests", methods=["GET"])
-def push_daily_quests():
-    tasks = load_tasks()
-    quests = get_todays_quests(tasks)
+# 今日のクエストのメッセージ
+def build_quest_message(user_id=USER_ID):
+    quests = get_todays_quests(user_id=user_id)
 
     if not quests:
         message = "🎯 今日のクエストはありません！ゆっくり休もう✨️"
@@ -221,37 +341,143 @@ def push_daily_quests():
                 f"📘 {q['subject']}：{q['title']}\n"
                 f"🗓️ 締切：{q['deadline']}\n\n"
             )
+    return message
+
+def prepare_daily_quests():
+    with Pipeline("daily_quests_prepare") as pipeline:
+        # 課題カタログの読み込みと達成記録の同期を並列に行う
+        pipeline.gather(catalog=get_catalog, completions=get_completion_mirror().refresh)
+        with pipeline.stage("messages"):
+            return {user_id: build_quest_message(user_id) for user_id in get_user_registry().active_users()}
+
+def send_daily_quests(messages=None):
+    with Pipeline("daily_quests") as pipeline:
+        if messages is None:
+            with pipeline.stage("prepare"):
+                messages = prepare_daily_quests()
+        with pipeline.stage("push"):
+            return push_scheduler.send(messages, send_key=f"daily_quests:{get_jst_date()}")
+
+EMOTION_LOG_PROMPT = (
+    "🧠 今日の感情はどうだった？\n"
+    "例）🧠 感情ログ：😐 集中50% コメント：あまりやる気が出なかったけど頑張った"
+)
+
+def prepare_emotion_log_push():
+    # 全員に同じ文面なのでmulticastにまとめて送られる
+    return dict.fromkeys(get_user_registry().active_users(), EMOTION_LOG_PROMPT)
+
+def send_emotion_log_push(messages=None):
+    with Pipeline("emotion_log") as pipeline:
+        if messages is None:
+            messages = prepare_emotion_log_push()
+        with pipeline.stage("push"):
+            return push_scheduler.send(messages, send_key=f"emotion_log:{get_jst_date()}")
+
+# アプリ内スケジューラー（送信の数分前に送信内容を作っておく）
+scheduler = Scheduler()
+scheduler.add_job("daily_quests", os.getenv("SCHEDULE_DAILY_QUESTS", "07:00"),
+                  run=send_daily_quests, warmup=prepare_daily_quests)
+scheduler.add_job("review_reminder", os.getenv("SCHEDULE_REVIEW_REMINDER", "08:00"),
+                  run=send_review_push, warmup=prepare_review_push)
+scheduler.add_job("emotion_log", os.getenv("SCHEDULE_EMOTION_LOG", "21:00"),
+                  run=send_emotion_log_push, warmup=prepare_emotion_log_push)
+scheduler.add_job("weekly_report", os.getenv("SCHEDULE_WEEKLY_REPORT", "SUN 20:00"),
+                  run=send_weekly_reports, warmup=prepare_weekly_reports)
+
+def start_background_tasks():
+    # 起動時にジャーナルに残った未書き込みの行を再送する
+    if WRITE_BUFFER_ENABLED:
+        get_write_buffer().start()
+
+    # SQLiteに保存する場合は、追記された行をシートへ書き出し続ける
+    start_exporter()
+
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+
+# 読み取り専用のデータ（課題カタログ・正規化のキャッシュ）をfork前に読み込んでおく
+def warm_shared_state():
+    try:
+        for entry in get_catalog().entries():
+            normalize(entry.subject)
+            normalize(entry.title)
+    except Exception as e:
+        print(f"⚠️ 課題カタログの事前読み込みに失敗: {e}")
+
+# fork後のワーカーで呼ぶ（親プロセスの接続を引き継がない）
+def after_fork():
+    get_sheets_manager().reset()
+    if line_bot_api.wrapped.is_initialized():
+        line_bot_api.http_client.reset()
+    if STORAGE_BACKEND == "sqlite":
+        get_sqlite_storage().reset_connections()
+    start_background_tasks()
+
+if PRELOAD_MODE:
+    warm_shared_state()
+else:
+    start_background_tasks()
+
+# ルートごとのレイテンシ計測
+@app.before_request
+def start_route_timer():
+    g.route_started = time.perf_counter()
+
+@app.after_request
+def record_route_latency(response):
+    started = getattr(g, "route_started", None)
+    if started is not None:
+        ROUTE_LATENCY.observe(time.perf_counter() - started,
+                              route=request.endpoint or "unknown", status=response.status_code)
+    return response
+
+# Prometheus形式のメトリクス
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return REGISTRY.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route("/scheduler_status", methods=["GET"])
+def scheduler_status():
+    return jsonify(scheduler.status()), 200
 
+# Push通知を送るためのエンドポイント（Render上で手動アクセス or スケジューラー用）
+@app.route("/push_daily_quests", methods=["GET"])
+def push_daily_quests():
     # LINEにPush送信
-    line_bot_api.push_message(
-        USER_ID,
-        TextSendMessage(text=message)
-    )
+    send_daily_quests()
 
     return "OK", 200
 
 @app.route("/push_daily_emotion_log", methods=["GET"])
 def push_daily_emotion_log():
-    message = (
-        "🧠 今日の感情はどうだった？\n"
-        "例）🧠 感情ログ：😐 集中50% コメント：あまりやる気が出なかったけど頑張った"
-    )
-
-    line_bot_api.push_message(
-        USER_ID,
-        TextSendMessage(text=message)
-    )
+    send_emotion_log_push()
 
     return "OK", 200
 
 @app.route("/push_weekly_report", methods=["GET"])
 def trigger_weekly_report():
     try:
-        send_weekly_report()
+        send_weekly_reports()
         return "✅️ Weekly report sent", 200
     except Exception as e:
         return f"❌️ Error: {str(e)}", 500
 
+# 週次レポートの総括コメントを事前に生成（定時Pushの数分前に呼ぶ）
+@app.route("/precompute_weekly_report", methods=["GET"])
+def precompute_weekly_report():
+    # 登録ユーザー全員分のコメント生成を始めておく（生成の完了は待たない）
+    scheduled = 0
+    for user_id in get_user_registry().active_users():
+        try:
+            precompute_summary_comment(user_id)
+            scheduled += 1
+        except Exception as e:
+            print(f"❌️ 総括コメントの事前生成に失敗（{user_id}）：{e}")
+    if scheduled == 0:
+        return "❌️ Error: no weekly report comment scheduled", 500
+    return f"✅️ Weekly report comment scheduled ({scheduled} users)", 200
+
 @app.route("/push_review_reminder", methods=["GET"])
 def push_review_reminder():
     try:
@@ -260,27 +486,149 @@ def push_review_reminder():
     except Exception as e:
         return f"❌️ Error: {str(e)}", 500
 
+# シートのミラーを破棄して次回アクセス時に読み直す（シートを手動編集したとき用）
+@app.route("/invalidate_mirror", methods=["GET"])
+def invalidate_mirror():
+    invalidate_mirrors()
+    return "✅️ Mirror invalidated", 200
+
 @app.route("/callback", methods=["POST"])
 def callback():
     signature = request.headers["X-Line-Signature"]
     body = request.get_data(as_text=True)
 
+    if WEBHOOK_ASYNC:
+        # 署名だけ検証してすぐに200を返し、処理はワーカーに任せる
+        try:
+            events = handler.parser.parse(body, signature)
+        except InvalidSignatureError:
+            abort(400)
+
+        for event in events:
+            if not event_pool.submit(event):
+                # キューが満杯のときはこのリクエスト内で処理する
+                process_event(event)
+        return "OK"
+
     try:
-        handler.handle(body, signature)
+        events = handler.parser.parse(body, signature)
     except Exception as e:
         abort(400)
 
+    # 複数のイベントはユーザーごとの順序を保ったまま並行して処理する
+    event_pool.process_batch(events)
     return "OK"
-def clean_text(text):
-    # 制御文字を除去
-    text = re.sub(r'[\x00-\x1F\x7F]', '', text)
-    return text.strip()
+
+# ワーカープールの状態（プールサイズの調整用）
+@app.route("/webhook_stats", methods=["GET"])
+def webhook_stats():
+    stats = event_pool.stats()
+    stats["dedup"] = get_seen_events().stats()
+    return jsonify(stats), 200
+
+# Sheets APIのクォータの使用状況
+@app.route("/sheets_stats", methods=["GET"])
+def sheets_stats():
+    return jsonify(get_quota_guard().stats()), 200
+
+# ワーカーから呼ばれるイベントの振り分け
+def dispatch_event(event):
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        handle_message(event)
+    elif isinstance(event, FollowEvent):
+        handle_follow(event)
+    elif isinstance(event, UnfollowEvent):
+        handle_unfollow(event)
+
+DUPLICATE_EVENTS = REGISTRY.register(Counter(
+    "uniquest_webhook_duplicate_events_total", "Redelivered webhook events skipped by event ID."))
+
+# 同じイベントIDの再送は処理しない（失敗したイベントは再送時に処理し直す）
+def process_event(event):
+    event_id = event_id_of(event)
+    if event_id and not get_seen_events().claim(event_id):
+        print(f"⚠️ 処理済みのイベントのためスキップします: {event_id}")
+        DUPLICATE_EVENTS.inc()
+        return
+    try:
+        dispatch_event(event)
+    except Exception:
+        if event_id:
+            get_seen_events().release(event_id)
+        raise
+
+event_pool = EventWorkerPool(process_event)
+
+REGISTRY.register(Gauge("uniquest_webhook_queue_depth", "Events waiting in the webhook worker queue.",
+                        lambda: event_pool.stats()["queue_depth"]))
+REGISTRY.register(Gauge("uniquest_sheets_reads_last_minute", "Sheets read requests sent in the last 60 seconds.",
+                        lambda: get_quota_guard().stats()["reads_last_minute"]))
+REGISTRY.register(Gauge("uniquest_sheets_writes_last_minute", "Sheets write requests sent in the last 60 seconds.",
+                        lambda: get_quota_guard().stats()["writes_last_minute"]))
+REGISTRY.register(Gauge("uniquest_storage_unexported_rows", "Rows stored locally but not yet exported to Sheets.",
+                        lambda: get_sqlite_storage().unexported_count() if STORAGE_BACKEND == "sqlite" else 0))
+REGISTRY.register(Gauge("uniquest_write_buffer_pending_rows", "Rows buffered but not yet written to Sheets.",
+                        lambda: get_write_buffer().pending_count() if WRITE_BUFFER_ENABLED else 0))
+
+# 返信（reply_tokenが失効していたらPushで送る）
+def reply_to_event(event, message):
+    try:
+        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=message))
+    except LineBotApiError as e:
+        user_id = getattr(event.source, "user_id", None)
+        if e.status_code != 400 or not user_id:
+            raise
+        print(f"⚠️ reply_tokenが無効のためPushで送信します: {e}")
+        line_bot_api.push_message(user_id, TextSendMessage(text=message))
+
+# 友だち追加で配信先に登録
+@handler.add(FollowEvent)
+def handle_follow(event):
+    get_user_registry().add(event.source.user_id)
+    reply_to_event(event, "👋 友だち追加ありがとう！\n「クエスト」で今日のクエストを確認できます。")
+
+# ブロックされたら配信先から外す
+@handler.add(UnfollowEvent)
+def handle_unfollow(event):
+    get_user_registry().remove(event.source.user_id)
 
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
     raw_text = event.message.text
     text = clean_text(raw_text)
-
+    user_id = getattr(event.source, "user_id", None) or USER_ID
+
+    # 友だち追加イベントより前からのユーザーも配信先に登録
+    if not get_user_registry().is_registered(user_id):
+        get_user_registry().add(user_id)
+
+    with COMMAND_LATENCY.time(command=command_name(text)):
+        reply = build_reply(text, user_id)
+
+    reply_to_event(event, reply)
+
+# メトリクス用のコマンド名（自由入力のテキストをラベルにしない）
+def command_name(text):
+    if text.startswith("✅"):
+        return "complete"
+    if text.startswith("🧠 感情ログ："):
+        return "emotion_log"
+    if text.startswith("🔁"):
+        return "review"
+    if text.startswith("復習間隔："):
+        return "review_interval"
+    if text.startswith("学習時間："):
+        return "study_budget"
+    if text == "今日の計画":
+        return "plan"
+    if text.startswith("傾向："):
+        return "trend"
+    if text == "月間レポート":
+        return "monthly_trend"
+    return {"クエスト": "quest", "週次レポート": "weekly_report", "合計": "total"}.get(text, "other")
+
+# コマンドごとの返信文を作る
+def build_reply(text, user_id):
     if text.startswith("✅️") or text.startswith("✅"):
         # 例：✅️福祉心理学:第1回(映像授業)
         try:
@@ -290,7 +638,7 @@ def handle_message(event):
             subject = normalize(subject)
             title = normalize(title)
 
-            success = record_task_completion(subject, title)
+            success = record_task_completion(subject, title, user_id)
             if success:
                 reply = f"📝 記録しました！\n✅️{subject}：{title}"
             else:
@@ -298,8 +646,7 @@ def handle_message(event):
         except Exception as e:
             reply = "❌️ 記録形式が正しくありません。\n例：✅️福祉心理学：第3回(映像授業)"
     elif text == "クエスト":
-        tasks = load_tasks()
-        quests = get_todays_quests(tasks)
+        quests = get_todays_quests(user_id=user_id)
 
         if not quests:
             reply = "🎯 今日のクエストはありません！ゆっくり休もう✨️"
@@ -312,13 +659,13 @@ def handle_message(event):
                 )
     elif text == "週次レポート":
         try:
-            send_weekly_report()
+            send_weekly_report(user_id)
             reply = "📊 週次レポートを送信しました！"
         except Exception as e:
             reply = f"❌️ エラー：{str(e)}"
     elif text == "合計":
         try:
-            total = get_tasks_total()
+            total = get_tasks_total(user_id)
             reply = f"📚️ 未達成タスク：{total}件"
         except Exception as e:
             reply = "❌️ 合計の取得中にエラーが発生しました。"
@@ -329,7 +676,7 @@ def handle_message(event):
                 emoji = match.group(1).strip()
                 focus = match.group(2).strip()
                 comment = match.group(3).strip()
-                record_emotion_log(emoji, focus, comment)
+                record_emotion_log(emoji, focus, comment, user_id)
                 reply = f"🧠 感情ログを記録しました！\n{emoji} 集中{focus}\nコメント：{comment or 'なし'}"
             else:
                 reply = "⚠️ 書式が正しくありません。\n例）🧠 感情ログ：🙂 集中70% コメント：今日はまあまあ集中できた"
@@ -344,17 +691,50 @@ def handle_message(event):
                 subject = match.group(1).strip()
                 title = match.group(2).strip()
                 stage = match.group(3).strip()
-                success = record_review_reminder(subject, title, stage)
+                success = record_review_reminder(subject, title, stage, user_id)
             if success:
                 reply = f"📝 復習を記録しました！🔁{subject}：{title}【{stage}】"
             else:
                 reply = "⚠️ すでに記録済みです。"
         except Exception as e:
             reply = "❌️ 記録形式が正しくありません。\n例：🔁福祉心理学：第3回(映像授業)【3回目】"
+    elif text.startswith("復習間隔："):
+        # 例) 復習間隔：1,3,7,14,30
+        try:
+            days = [int(day) for day in re.split(r"[,、\s]+", normalize(text.split("：", 1)[1])) if day]
+            days = review_schedule.set_user_intervals(user_id, days)
+            reply = f"🔁 復習間隔を設定しました：{'・'.join(str(day) for day in days)}日後"
+        except Exception as e:
+            reply = "❌️ 書式が正しくありません。\n例：復習間隔：1,3,7,14,30"
+    elif text == "今日の計画":
+        try:
+            reply = build_plan_message(user_id)
+        except Exception as e:
+            print(f"❌️ 今日の計画の作成に失敗: {e}")
+            reply = "❌️ 今日の計画の作成中にエラーが発生しました。"
+    elif text.startswith("学習時間："):
+        # 例) 学習時間：1.5 / 学習時間：90分
+        try:
+            hours = get_study_budgets().set(user_id, parse_study_hours(text.split("：", 1)[1]))
+            reply = f"⏱️ 1日の学習時間を{hours:g}時間に設定しました！\n「今日の計画」で予定を確認できます。"
+        except Exception as e:
+            reply = "❌️ 書式が正しくありません。\n例：学習時間：1.5 または 学習時間：90分"
+    elif text == "月間レポート":
+        try:
+            reply = build_monthly_trend_message(user_id)
+        except Exception as e:
+            print(f"❌️ 月間レポートの作成に失敗: {e}")
+            reply = "❌️ 月間レポートの作成中にエラーが発生しました。"
+    elif text.startswith("傾向："):
+        # 例) 傾向：30 / 傾向：2025-06-01〜2025-06-30
+        try:
+            reply = build_range_trend_message(text.split("：", 1)[1], user_id)
+        except ValueError:
+            reply = "❌️ 書式が正しくありません。\n例：傾向：30 または 傾向：2025-06-01〜2025-06-30"
+        except Exception as e:
+            print(f"❌️ 傾向レポートの作成に失敗: {e}")
+            reply = "❌️ 傾向レポートの作成中にエラーが発生しました。"
     else:
         reply = "📩 クエスト達成を記録したい場合は\n✅️福祉心理学：第3回(映像授業) のように送ってください！"
 
-    line_bot_api.reply_message(
-        event.reply_token,
-        TextSendMessage(text=reply)
-    )
\ No newline at end of file
+    return reply
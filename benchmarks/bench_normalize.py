@@ -0,0 +1,92 @@
+"""正規化処理のマイクロベンチマーク
+
+tasks.json の科目名・タイトルを対象に、旧実装（app.normalize / remove_emojis）と
+text_normalizer の処理時間を比較する。
+
+    python benchmarks/bench_normalize.py [--repeat 5] [--number 20]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+import unicodedata
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import text_normalizer
+
+
+# 旧実装（比較用にそのまま残す）
+def legacy_normalize(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize("NFKC", text)
+    text = re.sub(r'[\u200B-\u200D\uFEFFuFE0F]', '', text)
+    text = re.sub(r'[\x00-\x1F\x7F]', '', text)
+    text = re.sub(r'\s', '', text)
+    return text
+
+def legacy_remove_emojis(text):
+    emoji_pattern = re.compile(
+        "["
+        "\U0001F300-\U0001F64F"
+        "\U0001F680-\U0001F6FF"
+        "\u2600-\u26FF"
+        "\u2700-\u27BF"
+        "\uFE0F"
+        "]+", flags=re.UNICODE
+    )
+    return emoji_pattern.sub("", text).strip()
+
+
+def load_strings(path):
+    with open(path, "r", encoding="utf-8") as f:
+        tasks = json.load(f)
+    strings = []
+    for task in tasks:
+        strings.append(task["subject"])
+        strings.append(task["title"])
+    return strings
+
+def bench(label, func, strings, repeat, number):
+    timer = timeit.Timer(lambda: [func(s) for s in strings])
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    per_call = best / len(strings) * 1e9
+    print(f"{label:<32} {best * 1000:8.3f} ms/pass  {per_call:8.1f} ns/call")
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", default=os.path.join(ROOT, "tasks.json"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    strings = load_strings(args.tasks)
+    messages = [f"✅️{s}：第1回(映像授業)" for s in strings]
+    print(f"対象：{len(strings)}件（ユニーク {len(set(strings))}件）\n")
+
+    # 旧実装との差分（旧実装は u/F/E/0 の文字を誤って削除していた）
+    diffs = [s for s in strings if legacy_normalize(s) != text_normalizer.normalize(s)]
+    print(f"旧実装と結果が異なる文字列：{len(diffs)}件")
+    for s in diffs[:5]:
+        print(f"  {s!r}: {legacy_normalize(s)!r} -> {text_normalizer.normalize(s)!r}")
+    print()
+
+    legacy = bench("normalize (legacy)", legacy_normalize, strings, args.repeat, args.number)
+    text_normalizer._normalize_cached.cache_clear()
+    cold = bench("normalize (uncached)", text_normalizer._normalize_cached.__wrapped__, strings, args.repeat, args.number)
+    cached = bench("normalize (cached)", text_normalizer.normalize, strings, args.repeat, args.number)
+    print(f"  -> uncached x{legacy / cold:.1f}, cached x{legacy / cached:.1f}\n")
+
+    legacy = bench("remove_emojis (legacy)", legacy_remove_emojis, messages, args.repeat, args.number)
+    fast = bench("remove_emojis", text_normalizer.remove_emojis, messages, args.repeat, args.number)
+    print(f"  -> x{legacy / fast:.1f}")
+    print(f"\ncache: {text_normalizer.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""起動時間のベンチマーク
+
+新しいプロセスで app を import する時間と、最初・2回目の /callback の処理時間を測る。
+Sheets / LINE / OpenAI は benchmarks/fakes.py の代替を使う（通信なし）。
+
+    python benchmarks/bench_startup.py [--runs 5] [--rows 10000] [--top 15]
+
+--top を指定すると import に時間のかかったモジュールも表示する（python -X importtime）。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def child(rows):
+    """子プロセス側: import と最初のリクエストの時間をJSONで出力する"""
+    import contextlib
+    import io
+    import random
+    from datetime import datetime
+
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, BENCH_DIR)
+    from fakes import FakeLineBotApi, install_fake_sheets, text_event, webhook_payload
+    from load_test import CHANNEL_SECRET, bench_user_id, generate_completions, generate_tasks
+
+    today = datetime.now().date()
+    users = [bench_user_id(0)]
+    tasks = generate_tasks(2000, today, 0)
+    with open("tasks.json", "w", encoding="utf-8") as f:
+        json.dump(tasks, f, ensure_ascii=False)
+    os.environ["LINE_CHANNEL_SECRET"] = CHANNEL_SECRET
+    install_fake_sheets({"達成記録": generate_completions(tasks, users, rows, today, 0)})
+
+    result = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        import app
+        result["import_ms"] = (time.perf_counter() - started) * 1000
+        # 起動直後にLINE・OpenAIのクライアントが作られていないこと
+        result["line_client_created"] = app.line_bot_api.wrapped.is_initialized()
+        result["openai_loaded"] = "openai" in sys.modules
+        result["gspread_loaded"] = "gspread" in sys.modules
+
+        app.line_bot_api = app.InstrumentedProxy(FakeLineBotApi(), "line", "messaging_api")
+        client = app.app.test_client()
+        rng = random.Random(0)
+        for name in ("first_request_ms", "second_request_ms"):
+            body, headers = webhook_payload(CHANNEL_SECRET, [text_event(rng.choice(users), "クエスト")])
+            started = time.perf_counter()
+            response = client.post("/callback", data=body.encode("utf-8"), headers=headers)
+            result[name] = (time.perf_counter() - started) * 1000
+            result["status"] = response.status_code
+    print(json.dumps(result))
+
+
+def import_profile(top):
+    """python -X importtime の結果から、累積時間の大きい直下のimportを返す"""
+    workdir = tempfile.mkdtemp(prefix="uniquest-startup-")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]))
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    ).stderr
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # app から直接importされたもの（インデントが1段）
+        if name.startswith("   ") and not name.startswith("    "):
+            modules.append((int(cumulative) / 1000, name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=10000, help="達成記録シートの行数")
+    parser.add_argument("--top", type=int, default=0, help="import時間の上位を表示する件数")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.rows)
+        return
+
+    results = []
+    for _ in range(args.runs):
+        workdir = tempfile.mkdtemp(prefix="uniquest-startup-")
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--rows", str(args.rows)],
+            cwd=workdir, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["process_ms"] = (time.perf_counter() - started) * 1000
+        results.append(result)
+
+    for key in ("process_ms", "import_ms", "first_request_ms", "second_request_ms"):
+        values = [result[key] for result in results]
+        print(f"{key:<20} median {statistics.median(values):8.1f}ms  min {min(values):8.1f}ms  max {max(values):8.1f}ms")
+    last = results[-1]
+    print(f"起動直後に読み込み済み: LINEクライアント={last['line_client_created']} "
+          f"openai={last['openai_loaded']} gspread={last['gspread_loaded']}")
+
+    if args.top:
+        print("import時間の上位（累積）:")
+        for elapsed, name in import_profile(args.top):
+            print(f"  {elapsed:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
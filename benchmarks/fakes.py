@@ -0,0 +1,163 @@
+"""ベンチマーク用のGoogle Sheets / LINE / OpenAIのローカル代替
+
+外部サービスには一切接続せず、呼び出しごとに指定した時間だけ待つ。
+install_fake_sheets() は google_sheets_util を差し替えるため、アプリの
+モジュールを import する前に呼ぶこと。
+"""
+import base64
+import hashlib
+import hmac
+import json
+import re
+import sys
+import threading
+import time
+import types
+import uuid
+from types import SimpleNamespace
+
+from metrics import InstrumentedProxy
+from sheets_quota import GuardedWorksheet, get_quota_guard
+
+# 各シートのヘッダー（本番のシートと同じ並び）
+SHEET_HEADERS = {
+    "達成記録": ["Date", "Subject", "Title", "Timestamp", "UserId"],
+    "感情ログ": ["today", "感情", "集中度", "コメント", "UserId"],
+    "復習記録": ["Date", "Subject", "Title", "Stage", "Timestamp", "UserId"],
+    "週次レポート": ["週", "理想達成数", "実達成数", "達成率", "平均集中度", "感情傾向", "コメント", "UserId"],
+}
+
+
+class FakeWorksheet:
+    """行をメモリ上に持つワークシート（gspreadで使っているメソッドのみ）"""
+
+    def __init__(self, title, header, rows=(), latency=0.0):
+        self.title = title
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._rows = [list(header)] + [[str(v) for v in row] for row in rows]
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_all_values(self):
+        self._wait()
+        with self._lock:
+            return [list(row) for row in self._rows]
+
+    def get_all_records(self):
+        values = self.get_all_values()
+        header = values[0] if values else []
+        return [dict(zip(header, row)) for row in values[1:]]
+
+    def get_values(self, range_name):
+        # 「A10:E」形式の範囲のうち開始行だけを見る
+        self._wait()
+        start = int(re.match(r"[A-Z]+(\d+)", range_name).group(1))
+        with self._lock:
+            # gspread と同じく、該当する行がなければ [[]] を返す
+            return [list(row) for row in self._rows[start - 1:]] or [[]]
+
+    def append_row(self, values, **kwargs):
+        self._wait()
+        with self._lock:
+            self._rows.append([str(v) for v in values])
+
+    def append_rows(self, rows, **kwargs):
+        self._wait()
+        with self._lock:
+            self._rows.extend([str(v) for v in row] for row in rows)
+
+    def row_count(self):
+        with self._lock:
+            return len(self._rows) - 1
+
+
+def install_fake_sheets(rows_by_sheet=None, latency=0.0, quota=False):
+    """google_sheets_util をメモリ上のシートに差し替え、シート名 -> FakeWorksheet を返す
+
+    quota=True にすると本番と同じく SheetsQuotaGuard を通して呼ぶ。
+    """
+    rows_by_sheet = rows_by_sheet or {}
+    sheets = {
+        name: FakeWorksheet(name, header, rows_by_sheet.get(name, ()), latency)
+        for name, header in SHEET_HEADERS.items()
+    }
+    # 本番と同じくシート名・メソッド名ごとに計測する
+    proxies = {name: InstrumentedProxy(sheet, "sheets", name) for name, sheet in sheets.items()}
+    if quota:
+        proxies = {name: GuardedWorksheet(proxy, get_quota_guard(), name) for name, proxy in proxies.items()}
+
+    module = types.ModuleType("google_sheets_util")
+    module.get_sheet = lambda sheet_name="達成記録": proxies[sheet_name]
+    module.get_emotion_sheet = lambda: proxies["感情ログ"]
+    module.append_row_to_sheet = lambda sheet_name, row_values: proxies[sheet_name].append_row(row_values)
+    module.get_gspread_client = lambda: None
+    module.get_sheets_manager = lambda: SimpleNamespace(reset=lambda: None)
+    sys.modules["google_sheets_util"] = module
+    return sheets
+
+
+class FakeLineBotApi:
+    """LineBotApi の代替（送信内容は件数だけ数える）"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.calls = {}
+
+    def _call(self, name):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def reply_message(self, reply_token, messages, notification_disabled=False, timeout=None):
+        self._call("reply_message")
+
+    def push_message(self, to, messages, retry_key=None, notification_disabled=False, timeout=None):
+        self._call("push_message")
+
+    def multicast(self, to, messages, retry_key=None, notification_disabled=False, timeout=None):
+        self._call("multicast")
+
+
+class FakeOpenAIClient:
+    """OpenAI クライアントの代替（chat.completions.create のみ）"""
+
+    def __init__(self, latency=0.0, reply="今週もよく頑張りました！来週も一歩ずつ進めましょう。"):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model=None, messages=None, timeout=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        message = SimpleNamespace(content=self.reply)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def sign_body(channel_secret, body):
+    """X-Line-Signature の値（HMAC-SHA256 を Base64 にしたもの）"""
+    digest = hmac.new(channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+def text_event(user_id, text):
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": uuid.uuid4().hex.upper()[:26],
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"type": "text", "id": str(uuid.uuid4().int)[:18], "quoteToken": uuid.uuid4().hex, "text": text},
+    }
+
+def webhook_payload(channel_secret, events):
+    """/callback に送るボディと署名ヘッダー"""
+    body = json.dumps({"destination": "Ubenchmark", "events": events}, ensure_ascii=False)
+    return body, {"X-Line-Signature": sign_body(channel_secret, body), "Content-Type": "application/json"}
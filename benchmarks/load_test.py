@@ -0,0 +1,290 @@
+"""オフラインの負荷試験
+
+Google Sheets / LINE / OpenAI をメモリ上の代替（benchmarks/fakes.py）に差し替え、
+署名付きの /callback リクエストをコマンドごとに送って処理性能を測る。
+コマンドごとに requests/sec、p50/p95/p99 レイテンシ、1リクエストあたりの
+外部呼び出し回数を表示する。
+
+    python benchmarks/load_test.py [--rows 10000] [--tasks 2000] [--requests 200]
+        [--concurrency 8] [--sheets-latency 0.05] [--line-latency 0.02] [--openai-latency 0.5]
+        [--json result.json] [--baseline previous.json --tolerance 0.2]
+
+--baseline を指定すると p95 が基準より tolerance の割合以上悪化したコマンドを表示し、
+終了コード 1 で終わる（デプロイ前のチェック用）。
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def bench_user_id(index):
+    return f"Ubench{index:028d}"
+
+# library は読み込み時に既定のユーザーを決める（fakes 経由で読み込まれる）ので、その前に設定する
+os.environ["LINE_USER_ID"] = bench_user_id(0)
+
+from fakes import FakeLineBotApi, FakeOpenAIClient, install_fake_sheets, text_event, webhook_payload
+
+CHANNEL_SECRET = "benchmark-channel-secret"
+
+# 既定のワークロード（コマンド名, 全体に占める割合）
+DEFAULT_WORKLOAD = [
+    ("quest", 0.25),
+    ("total", 0.10),
+    ("complete", 0.20),
+    ("emotion_log", 0.10),
+    ("review", 0.10),
+    ("weekly_report", 0.05),
+    ("review_interval", 0.04),
+    ("plan", 0.05),
+    ("study_budget", 0.03),
+    ("monthly_trend", 0.03),
+    ("trend", 0.03),
+    ("other", 0.02),
+]
+
+
+def generate_tasks(count, today, seed):
+    """科目×回数の課題カタログを作る（締切は今日の前後に散らす）"""
+    rng = random.Random(seed)
+    subjects = [f"科目{index:03d}" for index in range(max(count // 15, 1))]
+    kinds = ["映像授業", "小テスト", "アンケート"]
+    tasks = []
+    for index in range(count):
+        subject = subjects[index % len(subjects)]
+        lesson = index // len(subjects) // len(kinds) + 1
+        deadline = today + timedelta(days=rng.randint(-10, 60))
+        tasks.append({
+            "subject": subject,
+            "title": f"第{lesson}回({kinds[index // len(subjects) % len(kinds)]})",
+            "deadline": deadline.strftime("%Y/%m/%d"),
+            "estimated_time_hours": str(rng.choice([0.1, 0.5, 1.0, 1.5])),
+        })
+    return tasks
+
+def generate_completions(tasks, users, count, today, seed):
+    """過去60日分の達成記録の行を作る"""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        task = rng.choice(tasks)
+        date = today - timedelta(days=rng.randint(0, 60))
+        rows.append([
+            date.strftime("%Y-%m-%d"),
+            task["subject"],
+            task["title"],
+            date.strftime("%Y-%m-%dT21:00:00"),
+            rng.choice(users),
+        ])
+    return rows
+
+def generate_emotions(users, today, seed):
+    rng = random.Random(seed)
+    rows = []
+    for user_id in users:
+        for days_ago in range(14):
+            date = today - timedelta(days=days_ago)
+            rows.append([date.strftime("%Y-%m-%d"), rng.choice("🙂😐😣"), f"{rng.randint(3, 10) * 10}%", "", user_id])
+    return rows
+
+
+def command_text(command, rng, tasks):
+    task = rng.choice(tasks)
+    if command == "quest":
+        return "クエスト"
+    if command == "total":
+        return "合計"
+    if command == "complete":
+        return f"✅{task['subject']}：{task['title']}"
+    if command == "emotion_log":
+        return f"🧠 感情ログ：{rng.choice('🙂😐😣')} 集中{rng.randint(3, 10) * 10}% コメント：ベンチマーク"
+    if command == "review":
+        return f"🔁{task['subject']}：{task['title']}【{rng.randint(1, 5)}回目】"
+    if command == "weekly_report":
+        return "週次レポート"
+    if command == "review_interval":
+        return "復習間隔：1,3,7,14,30"
+    if command == "plan":
+        return "今日の計画"
+    if command == "study_budget":
+        return rng.choice(["学習時間：1.5", "学習時間：90分", "学習時間：3時間"])
+    if command == "monthly_trend":
+        return "月間レポート"
+    if command == "trend":
+        return rng.choice(["傾向：7", "傾向：30", "傾向：90"])
+    return "こんにちは"
+
+def percentile(sorted_values, ratio):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(ratio * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def external_calls_by_service(before, after):
+    """EXTERNAL_CALLS のスナップショットの差分をサービスごとに合計する"""
+    calls = {}
+    for key, value in after.items():
+        delta = value - before.get(key, 0)
+        if delta:
+            calls[key[0]] = calls.get(key[0], 0) + delta
+    return calls
+
+
+def setup_app(args, workdir):
+    """代替のサービスを組み込んだ app を読み込む"""
+    today = datetime.now().date()
+    users = [bench_user_id(index) for index in range(args.users)]
+    tasks = generate_tasks(args.tasks, today, args.seed)
+    with open(os.path.join(workdir, "tasks.json"), "w", encoding="utf-8") as f:
+        json.dump(tasks, f, ensure_ascii=False)
+
+    # アプリのファイル（集計・ジャーナル・登録ユーザーなど）はすべて作業ディレクトリに置く
+    os.chdir(workdir)
+    os.environ["LINE_CHANNEL_SECRET"] = CHANNEL_SECRET
+    os.environ.setdefault("SUMMARY_COMMENT_BACKEND", "openai")
+    os.environ["WEBHOOK_ASYNC"] = "0"
+    os.environ["SCHEDULER_ENABLED"] = "0"
+    os.environ["STORAGE_BACKEND"] = args.storage
+
+    sheets = install_fake_sheets({
+        "達成記録": generate_completions(tasks, users, args.rows, today, args.seed),
+        "感情ログ": generate_emotions(users, today, args.seed),
+    }, latency=args.sheets_latency, quota=args.sheets_quota)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+        if args.storage == "sqlite":
+            # 代替のシートから取り込んでおく（以降の読み書きはSQLite）
+            import storage
+            storage.get_sqlite_storage().import_from_sheets()
+        from metrics import InstrumentedProxy
+        from summary_comment import get_comment_service
+
+        line = FakeLineBotApi(latency=args.line_latency)
+        app.line_bot_api = InstrumentedProxy(line, "line", "messaging_api")
+        app.push_scheduler.line_bot_api = app.line_bot_api
+        openai_client = FakeOpenAIClient(latency=args.openai_latency)
+        get_comment_service().backend._client = openai_client
+
+    return app, users, tasks, sheets
+
+def run_command(client, command, count, args, users, tasks, rng):
+    from metrics import EXTERNAL_CALLS
+
+    payloads = []
+    for _ in range(count):
+        user_id = rng.choice(users)
+        payloads.append(webhook_payload(CHANNEL_SECRET, [text_event(user_id, command_text(command, rng, tasks))]))
+
+    def post(payload):
+        body, headers = payload
+        started = time.perf_counter()
+        response = client.post("/callback", data=body.encode("utf-8"), headers=headers)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f"{command}: /callback returned {response.status_code}")
+        return elapsed
+
+    before = EXTERNAL_CALLS.snapshot()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        latencies = sorted(executor.map(post, payloads))
+    wall = time.perf_counter() - started
+    calls = external_calls_by_service(before, EXTERNAL_CALLS.snapshot())
+
+    return {
+        "command": command,
+        "requests": count,
+        "rps": round(count / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "calls_per_request": {service: round(value / count, 2) for service, value in sorted(calls.items())},
+    }
+
+
+def print_report(results, setup_seconds):
+    print(f"起動〜ミラー読み込み: {setup_seconds * 1000:.0f}ms")
+    print(f"{'command':<16}{'n':>6}{'rps':>9}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'maxms':>9}  calls/request")
+    for result in results:
+        calls = " ".join(f"{service}={value}" for service, value in result["calls_per_request"].items())
+        print(
+            f"{result['command']:<16}{result['requests']:>6}{result['rps']:>9}{result['p50_ms']:>9}"
+            f"{result['p95_ms']:>9}{result['p99_ms']:>9}{result['max_ms']:>9}  {calls or '-'}"
+        )
+
+def compare_baseline(results, baseline_path, tolerance):
+    """p95 が基準より悪化したコマンドを返す"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {result["command"]: result for result in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["command"])
+        if previous and previous["p95_ms"] and result["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append((result["command"], previous["p95_ms"], result["p95_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="達成記録シートの行数")
+    parser.add_argument("--tasks", type=int, default=2000, help="tasks.json の課題数")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=200, help="全コマンド合計のリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sheets-latency", type=float, default=0.05, help="Sheets呼び出し1回あたりの秒数")
+    parser.add_argument("--line-latency", type=float, default=0.02, help="LINE API呼び出し1回あたりの秒数")
+    parser.add_argument("--openai-latency", type=float, default=0.5, help="OpenAI呼び出し1回あたりの秒数")
+    parser.add_argument("--storage", choices=["sheets", "sqlite"], default="sheets", help="保存先")
+    parser.add_argument("--sheets-quota", action="store_true", help="Sheetsのクォータ制御を有効にする")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    parser.add_argument("--baseline", help="比較する過去の結果（--json で保存したもの）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p95の悪化を許容する割合")
+    args = parser.parse_args()
+    # 作業ディレクトリを移る前に絶対パスにしておく
+    args.json = os.path.abspath(args.json) if args.json else None
+    args.baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    workdir = tempfile.mkdtemp(prefix="uniquest-bench-")
+    started = time.perf_counter()
+    app, users, tasks, _ = setup_app(args, workdir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.get_completion_mirror().refresh()
+    setup_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    client = app.app.test_client()
+    results = [
+        run_command(client, command, max(int(args.requests * share), 1), args, users, tasks, rng)
+        for command, share in DEFAULT_WORKLOAD
+    ]
+    print_report(results, setup_seconds)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "setup_ms": round(setup_seconds * 1000, 1), "results": results},
+                      f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        regressions = compare_baseline(results, args.baseline, args.tolerance)
+        for command, previous, current in regressions:
+            print(f"❌️ {command}: p95 {previous}ms → {current}ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""日別の集計（ロールアップ）
+
+達成記録・感情ログの書き込み時に日ごとの集計を更新し、週次レポートは
+必要な日数分の集計だけを読む。既存のシートからの作り直しは
+
+    python daily_rollup.py backfill
+"""
+import os
+import sys
+import json
+import fcntl
+import threading
+from datetime import datetime, timedelta
+from storage import get_emotion_sheet
+from sheet_mirror import get_completion_mirror
+from write_buffer import pending_rows
+from pipeline import Pipeline
+from library import DEFAULT_USER_ID, record_user_id
+
+ROLLUP_PATH = os.getenv("ROLLUP_PATH", "daily_rollups.json")
+
+
+def _empty_day():
+    return {"completions": 0, "subjects": [], "focus_sum": 0, "focus_count": 0, "emojis": {}}
+
+def parse_focus(value):
+    """「70%」形式の集中度を数値に変換（不正な値は None）"""
+    try:
+        return int(str(value).replace("%", "").strip())
+    except ValueError:
+        return None
+
+
+class DailyRollupStore:
+    """ユーザー・日付（YYYY-MM-DD）ごとの集計をJSONファイルに保持する
+
+    複数のワーカープロセスから更新されるため、更新はファイルロックを取って
+    最新の内容を読み直してから行い、読み込み時も更新時刻が変わっていれば読み直す。
+    """
+
+    def __init__(self, path=ROLLUP_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._days = {}
+        self._mtime = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            days = json.load(f)
+        # ユーザー別になる前の形式（日付がトップレベル）は既定のユーザーの集計とみなす
+        if any(key[:4].isdigit() for key in days):
+            days = {DEFAULT_USER_ID: days}
+        self._days = days
+        self._mtime = mtime
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._days, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _update(self, apply, create=False):
+        # 集計ファイルがまだない場合は backfill で作るまで更新しない
+        if not create and not self.exists():
+            return
+        with self._lock, open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload_if_changed()
+                apply(self._days)
+                self._save()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def record_completion(self, date, subject, user_id=DEFAULT_USER_ID):
+        def apply(days):
+            day = days.setdefault(user_id, {}).setdefault(date, _empty_day())
+            day["completions"] += 1
+            if subject not in day["subjects"]:
+                day["subjects"].append(subject)
+        self._update(apply)
+
+    def record_emotion(self, date, emoji, focus, user_id=DEFAULT_USER_ID):
+        focus_value = parse_focus(focus)
+        if focus_value is None:
+            return
+
+        def apply(days):
+            day = days.setdefault(user_id, {}).setdefault(date, _empty_day())
+            day["focus_sum"] += focus_value
+            day["focus_count"] += 1
+            day["emojis"][emoji] = day["emojis"].get(emoji, 0) + 1
+        self._update(apply)
+
+    def get_days(self, start_date, end_date, user_id=DEFAULT_USER_ID):
+        """start_date〜end_date（両端含む）の日別集計を日付順に返す"""
+        with self._lock:
+            self._reload_if_changed()
+            user_days = self._days.get(user_id, {})
+            days = []
+            current = start_date
+            while current <= end_date:
+                key = current.strftime("%Y-%m-%d")
+                days.append((key, user_days.get(key, _empty_day())))
+                current += timedelta(days=1)
+            return days
+
+    def replace_all(self, days):
+        self._update(lambda current: (current.clear(), current.update(days)), create=True)
+
+
+def build_rollups(completion_records, emotion_records):
+    """シートのレコードからユーザー別・日別の集計を作る"""
+    days = {}
+    for row in completion_records:
+        date = str(row.get("Date", "")).strip()
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            continue
+        day = days.setdefault(record_user_id(row), {}).setdefault(date, _empty_day())
+        day["completions"] += 1
+        if row.get("Subject") not in day["subjects"]:
+            day["subjects"].append(row.get("Subject"))
+
+    for row in emotion_records:
+        date = str(row.get("today", "")).strip()
+        focus = parse_focus(row.get("集中度", ""))
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            continue
+        if focus is None:
+            continue
+        day = days.setdefault(record_user_id(row), {}).setdefault(date, _empty_day())
+        day["focus_sum"] += focus
+        day["focus_count"] += 1
+        emoji = row.get("感情")
+        day["emojis"][emoji] = day["emojis"].get(emoji, 0) + 1
+    return days
+
+def backfill(store=None):
+    """既存の達成記録・感情ログから集計を作り直す"""
+    store = store or get_rollup_store()
+    # 2つのシートは並列に読み込む
+    with Pipeline("rollup_backfill") as pipeline:
+        fetched = pipeline.gather(
+            completions=get_completion_mirror().get_all_records,
+            emotions=lambda: get_emotion_sheet().get_all_records(),
+        )
+    completion_records = fetched["completions"]
+    emotion_records = fetched["emotions"]
+    # まだシートに書き込まれていない感情ログも含める
+    for row in pending_rows("感情ログ"):
+        today, emoji, focus = row[:3]
+        user_id = row[4] if len(row) > 4 else ""
+        emotion_records.append({"today": today, "感情": emoji, "集中度": focus, "UserId": user_id})
+
+    days = build_rollups(completion_records, emotion_records)
+    store.replace_all(days)
+    print(f"✅️ 日別集計を作り直しました（{len(days)}人分）")
+    return days
+
+
+_store = DailyRollupStore()
+
+
+def get_rollup_store():
+    return _store
+
+def ensure_rollups():
+    """集計ファイルがなければシートから作る"""
+    if not _store.exists():
+        backfill(_store)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["backfill"]:
+        backfill()
+    else:
+        print("usage: python daily_rollup.py backfill")
+        sys.exit(1)
@@ -0,0 +1,180 @@
+import bisect
+import threading
+from array import array
+from collections import Counter, deque
+from datetime import date
+from daily_rollup import parse_focus
+from sheet_mirror import get_mirror
+from library import record_user_id, DEFAULT_USER_ID
+
+# 集中度が記録されていない行の値
+MISSING_FOCUS = -1
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+
+
+class _UserSeries:
+    """1ユーザー分の感情ログ（日付順の列ごとの配列）"""
+
+    __slots__ = ("dates", "focus", "emojis")
+
+    def __init__(self):
+        # 日付の序数・集中度（%）・絵文字のコード
+        self.dates = array("l")
+        self.focus = array("h")
+        self.emojis = array("H")
+
+    def add(self, ordinal, focus, emoji_code):
+        # 記録はほぼ日付順に届くので、末尾への追加で済む
+        if not self.dates or self.dates[-1] <= ordinal:
+            position = len(self.dates)
+        else:
+            position = bisect.bisect_right(self.dates, ordinal)
+        self.dates.insert(position, ordinal)
+        self.focus.insert(position, focus)
+        self.emojis.insert(position, emoji_code)
+
+    def bounds(self, start_ordinal, end_ordinal):
+        return (bisect.bisect_left(self.dates, start_ordinal), bisect.bisect_right(self.dates, end_ordinal))
+
+
+class EmotionTimeSeries:
+    """感情ログの列指向インデックス
+
+    ミラーの行をユーザーごとに日付・集中度・絵文字の配列へ変換して保持し、
+    期間の絞り込みは日付の二分探索と配列のスライスで行う。
+    新しい行はミラーのリスナー経由で追加され、全件の読み直し時だけ作り直す。
+    """
+
+    def __init__(self, mirror):
+        self.mirror = mirror
+        self._lock = threading.Lock()
+        self._series = {}
+        # 絵文字 <-> コード
+        self._emoji_codes = {}
+        self._emoji_list = []
+        self._built_for = None
+        # ミラーから届いた行（ミラーのロック内で積まれる）
+        self._events = deque()
+        mirror.add_listener(self._events.append)
+
+    def _emoji_code(self, emoji):
+        code = self._emoji_codes.get(emoji)
+        if code is None:
+            code = len(self._emoji_list)
+            self._emoji_codes[emoji] = code
+            self._emoji_list.append(emoji)
+        return code
+
+    def _add(self, record):
+        day = _parse_date(record.get("today", ""))
+        if day is None:
+            return
+        focus = parse_focus(record.get("集中度", ""))
+        if focus is not None and not 0 <= focus <= 1000:
+            focus = None
+        series = self._series.get(record_user_id(record))
+        if series is None:
+            series = self._series[record_user_id(record)] = _UserSeries()
+        series.add(day.toordinal(), MISSING_FOCUS if focus is None else focus,
+                   self._emoji_code(record.get("感情", "")))
+
+    def _refresh(self):
+        self.mirror.refresh()
+        if self._built_for != self.mirror.generation:
+            self._events.clear()
+            records = self.mirror.get_all_records()
+            self._built_for = self.mirror.generation
+            self._series = {}
+            for record in records:
+                self._add(record)
+            # 読み込み中に届いた行のうち、すでに反映したものは読み飛ばす
+            loaded = {id(record) for record in records}
+            while self._events:
+                record = self._events.popleft()
+                if id(record) not in loaded:
+                    self._add(record)
+            print(f"🧠 感情ログの時系列を作成しました（{len(records)}件）")
+            return
+
+        while self._events:
+            self._add(self._events.popleft())
+
+    def query(self, start, end, user_id=DEFAULT_USER_ID):
+        """start〜end（両端含む）の (日付の序数, 集中度, 絵文字) の配列"""
+        with self._lock:
+            self._refresh()
+            series = self._series.get(user_id)
+            if series is None:
+                return array("l"), array("h"), []
+            lo, hi = series.bounds(start.toordinal(), end.toordinal())
+            emojis = [self._emoji_list[code] for code in series.emojis[lo:hi]]
+            return series.dates[lo:hi], series.focus[lo:hi], emojis
+
+    def daily_focus(self, start, end, user_id=DEFAULT_USER_ID):
+        """日ごとの平均集中度（記録のない日は None）を start から順に返す"""
+        dates, focus, _ = self.query(start, end, user_id)
+        start_ordinal = start.toordinal()
+        sums = [0] * (end.toordinal() - start_ordinal + 1)
+        counts = [0] * len(sums)
+        for ordinal, value in zip(dates, focus):
+            if value != MISSING_FOCUS:
+                sums[ordinal - start_ordinal] += value
+                counts[ordinal - start_ordinal] += 1
+        return [round(total / count, 1) if count else None for total, count in zip(sums, counts)]
+
+    def emoji_distribution(self, start, end, user_id=DEFAULT_USER_ID):
+        _, _, emojis = self.query(start, end, user_id)
+        return Counter(emoji for emoji in emojis if emoji)
+
+
+def rolling_average(values, window):
+    """None を除いた直近 window 日分の平均（データがなければ None）"""
+    averages = []
+    total = 0.0
+    count = 0
+    recent = deque()
+    for value in values:
+        recent.append(value)
+        if value is not None:
+            total += value
+            count += 1
+        if len(recent) > window:
+            dropped = recent.popleft()
+            if dropped is not None:
+                total -= dropped
+                count -= 1
+        averages.append(round(total / count, 1) if count else None)
+    return averages
+
+def correlation(xs, ys):
+    """ピアソンの相関係数（計算できなければ None）"""
+    pairs = [(x, y) for x, y in zip(xs, ys) if x is not None and y is not None]
+    if len(pairs) < 3:
+        return None
+    n = len(pairs)
+    mean_x = sum(x for x, _ in pairs) / n
+    mean_y = sum(y for _, y in pairs) / n
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in pairs)
+    var_x = sum((x - mean_x) ** 2 for x, _ in pairs)
+    var_y = sum((y - mean_y) ** 2 for _, y in pairs)
+    if not var_x or not var_y:
+        return None
+    return cov / (var_x * var_y) ** 0.5
+
+
+_series = None
+_series_lock = threading.Lock()
+
+
+def get_emotion_series():
+    global _series
+    with _series_lock:
+        if _series is None:
+            _series = EmotionTimeSeries(get_mirror("感情ログ"))
+        return _series
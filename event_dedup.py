@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from collections import OrderedDict
+
+# 処理済みのWebhookイベントIDの記録（JSON Lines）
+SEEN_EVENTS_PATH = os.getenv("SEEN_EVENTS_PATH", "seen_events.jsonl")
+# 何秒間、同じイベントIDを重複とみなすか（LINEの再送はこの時間内に届く）
+WEBHOOK_DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", "86400"))
+# 覚えておくイベントIDの最大数（古いものから捨てる）
+WEBHOOK_DEDUP_MAX_SIZE = int(os.getenv("WEBHOOK_DEDUP_MAX_SIZE", "20000"))
+
+
+def event_id_of(event):
+    """Webhookイベントの一意なID（古いSDK・イベントではメッセージIDで代用）"""
+    event_id = getattr(event, "webhook_event_id", None)
+    if event_id:
+        return event_id
+    message = getattr(event, "message", None)
+    message_id = getattr(message, "id", None)
+    return f"message:{message_id}" if message_id else None
+
+
+class SeenEventStore:
+    """処理済みのイベントIDを期限付きで覚えておく集合
+
+    IDはファイルに追記し、他のワーカープロセスが追記した分も読み込んでから判定する
+    （再送が別のワーカーに届いても二重に処理しない）。ファイルは件数が上限の2倍を
+    超えたら、期限内のIDだけに書き直す。
+    """
+
+    def __init__(self, path=SEEN_EVENTS_PATH, ttl=WEBHOOK_DEDUP_TTL, max_size=WEBHOOK_DEDUP_MAX_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # イベントID -> 記録した時刻（古い順）
+        self._seen = OrderedDict()
+        # ファイルのどこまで読んだか（inode, オフセット）
+        self._read_position = (None, 0)
+        self._lines = 0
+        self._stats = {"claimed": 0, "duplicates": 0, "released": 0}
+
+    def _evict(self, now):
+        while self._seen:
+            event_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.ttl and len(self._seen) <= self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    def _read_new_lines(self, f):
+        inode = os.fstat(f.fileno()).st_ino
+        known_inode, offset = self._read_position
+        if inode != known_inode or offset > os.fstat(f.fileno()).st_size:
+            # 書き直されたファイルは最初から読み直す
+            self._seen.clear()
+            self._lines = 0
+            offset = 0
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            self._lines += 1
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:
+                continue
+            if record.get("released"):
+                self._seen.pop(record["id"], None)
+            else:
+                self._seen[record["id"]] = record["ts"]
+                self._seen.move_to_end(record["id"])
+        self._read_position = (inode, offset)
+
+    def _append(self, f, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        f.write(line)
+        f.flush()
+        inode, offset = self._read_position
+        self._read_position = (inode, offset + len(line))
+        self._lines += 1
+
+    def _compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for event_id, seen_at in self._seen.items():
+                f.write(json.dumps({"id": event_id, "ts": seen_at}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self._read_position = (os.stat(self.path).st_ino, os.stat(self.path).st_size)
+        self._lines = len(self._seen)
+
+    def _open_locked(self):
+        # ロック待ちの間に他のプロセスが書き直した場合は、新しいファイルを開き直す
+        while True:
+            f = open(self.path, "a+b")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                return f
+            f.close()
+
+    def _locked(self, apply):
+        with self._lock, self._open_locked() as f:
+            try:
+                self._read_new_lines(f)
+                now = time.time()
+                self._evict(now)
+                result = apply(f, now)
+                if self._lines > self.max_size * 2:
+                    self._compact()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def claim(self, event_id):
+        """初めて見るIDなら記録して True、処理済み（処理中）なら False"""
+        def apply(f, now):
+            seen_at = self._seen.get(event_id)
+            if seen_at is not None and now - seen_at <= self.ttl:
+                self._stats["duplicates"] += 1
+                return False
+            self._seen[event_id] = now
+            self._seen.move_to_end(event_id)
+            self._append(f, {"id": event_id, "ts": now})
+            self._stats["claimed"] += 1
+            return True
+        return self._locked(apply)
+
+    def release(self, event_id):
+        """処理に失敗したIDを忘れる（再送されたら処理し直す）"""
+        def apply(f, now):
+            if self._seen.pop(event_id, None) is not None:
+                self._append(f, {"id": event_id, "released": True})
+                self._stats["released"] += 1
+        self._locked(apply)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._seen)
+        return stats
+
+
+_store = SeenEventStore()
+
+
+def get_seen_events():
+    return _store
@@ -1,30 +1,148 @@
 import os
 import json
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import threading
+from datetime import datetime, timezone
+from metrics import InstrumentedProxy, track_external
+from sheets_quota import GuardedWorksheet, get_quota_guard
 
-# Googleシート用の共通関数
-def get_gspread_client():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    raw_cred = os.environ.get("GOOGLE_CREDENTIALS_JSON")
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+SPREADSHEET_NAME = "UniQuest_DB"
+
+# トークン失効の何秒前に更新するか
+TOKEN_REFRESH_MARGIN = int(os.getenv("SHEETS_TOKEN_REFRESH_MARGIN", "300"))
+# HTTPコネクションプールのサイズ
+HTTP_POOL_SIZE = int(os.getenv("SHEETS_HTTP_POOL_SIZE", "10"))
+
+
+class SheetsClientManager:
+    """プロセス内で共有するGoogle Sheetsクライアント
+
+    認証・スプレッドシートの解決・ワークシートの取得は初回のみ行い、
+    以降はキャッシュしたハンドルと同じHTTPセッションを使い回す。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._session = None
+        # トークン更新用（認証ヘッダーを付けない素のセッション）
+        self._token_session = None
+        self._client = None
+        self._spreadsheet = None
+        # 一度解決したスプレッドシートのキー（環境変数で直接指定も可）
+        self._spreadsheet_key = os.getenv("GOOGLE_SPREADSHEET_KEY")
+        self._worksheets = {}
+
+    def _authorize(self):
+        # gspread・認証ライブラリは読み込みが重いので、初めて使うときに読み込む
+        import gspread
+        import requests
+        from google.auth.transport.requests import AuthorizedSession
+        from gspread.utils import convert_credentials
+        from oauth2client.service_account import ServiceAccountCredentials
+        from requests.adapters import HTTPAdapter
+
+        raw_cred = os.environ.get("GOOGLE_CREDENTIALS_JSON")
+
+        if raw_cred is None:
+            raise Exception("GOOGLE_CREDENTIALS_JSON is not set")
+
+        creds_dict = json.loads(raw_cred)
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
+        credentials = convert_credentials(creds)
+
+        # 全リクエストで共有するコネクションプール付きセッション
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
 
-    if raw_cred is None:
-        raise Exception("GOOGLE_CREDENTIALS_JSON is not set")
+        self._credentials = credentials
+        self._session = session
+        if self._token_session is None:
+            self._token_session = requests.Session()
+        self._client = InstrumentedProxy(gspread.Client(auth=creds, session=session), "sheets", SPREADSHEET_NAME)
+        print("🔑 Google Sheetsクライアントを認証しました")
 
-    creds_dict = json.loads(raw_cred)
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    return gspread.authorize(creds)
+    def _refresh_if_needed(self):
+        # 失効間近のトークンはリクエスト前に先回りして更新する
+        # google-auth の expiry はタイムゾーンなしのUTC（timestamp() だとローカル時刻とみなされる）
+        expiry = self._credentials.expiry
+        if expiry is not None:
+            now = datetime.now(timezone.utc)
+            if expiry.tzinfo is None:
+                now = now.replace(tzinfo=None)
+            if (expiry - now).total_seconds() > TOKEN_REFRESH_MARGIN:
+                return
+        if expiry is None and self._credentials.token:
+            return
+        from google.auth.transport.requests import Request
+        with track_external("google_oauth", "token", "refresh"):
+            self._credentials.refresh(Request(self._token_session))
+
+    def get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._authorize()
+            self._refresh_if_needed()
+            return self._client
+
+    def get_spreadsheet(self):
+        with self._lock:
+            client = self.get_client()
+            if self._spreadsheet is None:
+                if self._spreadsheet_key:
+                    spreadsheet = get_quota_guard().execute("read", client.open_by_key, self._spreadsheet_key)
+                else:
+                    # 名前での検索は初回のみ。以降はキーで参照する
+                    spreadsheet = get_quota_guard().execute("read", client.open, SPREADSHEET_NAME)
+                    self._spreadsheet_key = spreadsheet.id
+                self._spreadsheet = InstrumentedProxy(spreadsheet, "sheets", SPREADSHEET_NAME)
+            return self._spreadsheet
+
+    def get_worksheet(self, sheet_name):
+        with self._lock:
+            spreadsheet = self.get_spreadsheet()
+            worksheet = self._worksheets.get(sheet_name)
+            if worksheet is None:
+                # ワークシートの操作はシート名・メソッド名ごとに計測し、
+                # クォータ（同時読み取りのまとめ・レート制限・再試行）を通して呼ぶ
+                raw = get_quota_guard().execute("read", spreadsheet.worksheet, sheet_name)
+                worksheet = GuardedWorksheet(InstrumentedProxy(raw, "sheets", sheet_name), get_quota_guard(), sheet_name)
+                self._worksheets[sheet_name] = worksheet
+            return worksheet
+
+    def reset(self):
+        """認証情報・キャッシュを破棄（次回アクセス時に再認証）"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            if self._token_session is not None:
+                self._token_session.close()
+            self._token_session = None
+            self._credentials = None
+            self._session = None
+            self._client = None
+            self._spreadsheet = None
+            self._worksheets = {}
+
+
+_manager = SheetsClientManager()
+
+
+def get_sheets_manager():
+    return _manager
+
+# Googleシート用の共通関数
+def get_gspread_client():
+    return _manager.get_client()
 
 # Google Sheets接続設定
 def get_sheet(sheet_name="達成記録"):
-    # スプレッドシートの名前を指定
-    client = get_gspread_client()
-    return client.open("UniQuest_DB").worksheet(sheet_name)
+    return _manager.get_worksheet(sheet_name)
 
 def get_emotion_sheet():
-    client = get_gspread_client()
-    return client.open("UniQuest_DB").worksheet("感情ログ")
+    return get_sheet("感情ログ")
 
 def append_row_to_sheet(sheet_name, row_values):
     sheet = get_sheet(sheet_name)
-    sheet.append_row(row_values)
\ No newline at end of file
+    sheet.append_row(row_values)
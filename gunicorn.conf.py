@@ -0,0 +1,23 @@
+"""gunicornの設定
+
+    gunicorn -c gunicorn.conf.py app:app
+
+UNIQUEST_PRELOAD=1 にすると、マスタープロセスでappを読み込んでからforkする。
+課題カタログや正規化のキャッシュなど読み取り専用のデータは各ワーカーで共有され、
+ワーカーごとの起動時間とメモリが減る。Sheetsの接続やバックグラウンドのスレッドは
+fork後に各ワーカーで作り直す（post_fork）。
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+
+preload_app = os.getenv("UNIQUEST_PRELOAD", "0") == "1"
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import app
+        app.after_fork()
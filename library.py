@@ -1,6 +1,20 @@
 from zoneinfo import ZoneInfo
 from datetime import datetime
 import json
+import os
+import sys
+import re
+import time
+import threading
+from text_normalizer import normalize
+
+# ユーザーIDの列がない（複数ユーザー対応前の）行の持ち主
+DEFAULT_USER_ID = os.getenv("LINE_USER_ID", "U7f366710ac3959bbaa4041a5c6a2dc5c")
+
+# ログレベル（DEBUGにすると行単位の詳細ログを出力）
+LOG_LEVEL = os.getenv("UNIQUEST_LOG_LEVEL", "INFO").upper()
+# jsonにすると1行1件のJSON形式でログを出力
+LOG_FORMAT = os.getenv("UNIQUEST_LOG_FORMAT", "text").lower()
 
 # UTCをJSTに変換(時間)
 def get_jst_time():
@@ -16,7 +30,114 @@ def get_jst_date():
 
     return aware_jst.strftime("%Y-%m-%d")
 
-# タスクの読み込み
-def load_tasks():
-    with open("tasks.json", "r", encoding="utf-8") as f:
-        return json.load(f)
\ No newline at end of file
+# 日付の形式に対応
+def parse_deadline(date_str):
+    """ハイフン・スラッシュどちらの形式にも対応"""
+    for fmt in ("%Y-%m-%d", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(date_str, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unsupported date format: {date_str}")
+
+# 「第◯回」の抽出
+def extract_lesson_number(title):
+    """タイトルから「第◯回」の数字を抽出"""
+    match = re.search(r"第(\d+)回", title)
+    return int(match.group(1)) if match else 9999 #該当なしは後回し
+
+# タスクの読み込み（通常は task_catalog.get_catalog() を使う）
+def load_tasks(path="tasks.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# ログレベルの切り替え
+def set_log_level(level):
+    global LOG_LEVEL
+    LOG_LEVEL = level.upper()
+
+def is_debug_enabled():
+    return LOG_LEVEL == "DEBUG"
+
+# 構造化ログ（UNIQUEST_LOG_FORMAT=json のときはJSONで1行ずつ出力）
+def log_event(level, message, **fields):
+    if LOG_FORMAT == "json":
+        record = {"ts": get_jst_time(), "level": level, "message": message}
+        record.update(fields)
+        print(json.dumps(record, ensure_ascii=False, default=str), file=sys.stdout, flush=True)
+    else:
+        extra = " ".join(f"{key}={value}" for key, value in fields.items())
+        print(f"[{level}] {message}" + (f" {extra}" if extra else ""))
+
+# デバッグログ（DEBUGレベルのときだけ出力）
+def debug_log(message, **fields):
+    if is_debug_enabled():
+        log_event("DEBUG", message, **fields)
+
+# シートの行の持ち主（UserId列が空なら既定のユーザー）
+def record_user_id(record):
+    return str(record.get("UserId") or "").strip() or DEFAULT_USER_ID
+
+
+class TokenBucket:
+    """トークンバケットによるレート制限（rate件/秒、最大capacity件まで貯まる）"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _fill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            self._fill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """トークンが貯まるまで待って取得し、待った秒数を返す"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._fill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def available(self):
+        with self._lock:
+            self._fill()
+            return self._tokens
+
+
+class LazyObject:
+    """初めて属性にアクセスしたときに factory() でオブジェクトを作るラッパー"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def is_initialized(self):
+        return self._instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
@@ -0,0 +1,98 @@
+import os
+import copy
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from linebot import LineBotApi
+from linebot.http_client import HttpClient, RequestsHttpClient, RequestsHttpResponse
+
+# LINE APIへのHTTPコネクションプールのサイズ（Pushの並列数以上にする）
+LINE_HTTP_POOL_SIZE = int(os.getenv("LINE_HTTP_POOL_SIZE", "10"))
+
+
+class PooledRequestsHttpClient(RequestsHttpClient):
+    """requests.Session を使い回す LINE SDK のHTTPクライアント
+
+    SDK標準の RequestsHttpClient はリクエストごとに requests.post() を呼ぶため、
+    毎回TCP/TLS接続を張り直す。同じセッションのコネクションプールを共有して、
+    並列のPushでも接続を再利用する。
+    """
+
+    def __init__(self, timeout=HttpClient.DEFAULT_TIMEOUT, pool_size=LINE_HTTP_POOL_SIZE):
+        super().__init__(timeout)
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._session = None
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def _request(self, method, url, timeout, **kwargs):
+        response = self._get_session().request(
+            method, url, timeout=self.timeout if timeout is None else timeout, **kwargs)
+        return RequestsHttpResponse(response)
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._request("GET", url, timeout, headers=headers, params=params, stream=stream)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._request("POST", url, timeout, headers=headers, data=data)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._request("DELETE", url, timeout, headers=headers, data=data)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._request("PUT", url, timeout, headers=headers, data=data)
+
+    def reset(self):
+        """コネクションプールを破棄する（fork後の子プロセスで親の接続を使わない）"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+
+class RetryKeyLineBotApi(LineBotApi):
+    """retry_key をリクエストごとのヘッダーで送る LineBotApi
+
+    SDK（v2）は retry_key をインスタンス共通の self.headers に書き込んだまま消さないため、
+    以降の reply_message などにも古い X-Line-Retry-Key が付いて 409 で捨てられ、
+    並列のPushでは別の送信のキーが混ざる。retry_key 付きの呼び出しはヘッダーだけを
+    複製したクライアントで行い、共有のヘッダーは書き換えない（HTTPセッションは共有）。
+    """
+
+    def _with_retry_key(self, retry_key):
+        client = copy.copy(self)
+        client.headers = dict(self.headers)
+        client.headers["X-Line-Retry-Key"] = retry_key
+        return client
+
+    def push_message(self, to, messages, retry_key=None, **kwargs):
+        if retry_key:
+            return LineBotApi.push_message(self._with_retry_key(retry_key), to, messages, retry_key=retry_key, **kwargs)
+        return super().push_message(to, messages, **kwargs)
+
+    def multicast(self, to, messages, retry_key=None, **kwargs):
+        if retry_key:
+            return LineBotApi.multicast(self._with_retry_key(retry_key), to, messages, retry_key=retry_key, **kwargs)
+        return super().multicast(to, messages, **kwargs)
+
+    def broadcast(self, messages, retry_key=None, **kwargs):
+        if retry_key:
+            return LineBotApi.broadcast(self._with_retry_key(retry_key), messages, retry_key=retry_key, **kwargs)
+        return super().broadcast(messages, **kwargs)
+
+    def narrowcast(self, messages, retry_key=None, **kwargs):
+        if retry_key:
+            return LineBotApi.narrowcast(self._with_retry_key(retry_key), messages, retry_key=retry_key, **kwargs)
+        return super().narrowcast(messages, **kwargs)
+
+
+def create_line_bot_api(channel_access_token):
+    return RetryKeyLineBotApi(channel_access_token, http_client=PooledRequestsHttpClient)
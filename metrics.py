@@ -0,0 +1,183 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# レイテンシ用の既定のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def snapshot(self):
+        """ラベルの組 -> 値 のコピー（差分の計算用）"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        # ラベル -> [バケットごとの件数, 合計, 件数]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_number(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """値を取得する関数を登録しておき、出力時に呼ぶゲージ"""
+
+    def __init__(self, name, documentation, func):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            lines.append(f"{self.name} {_format_number(self.func())}")
+        except Exception:
+            pass
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheusのテキスト形式で出力"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+COMMAND_LATENCY = REGISTRY.register(Histogram(
+    "uniquest_command_latency_seconds", "Latency of LINE message commands.", ["command"]))
+ROUTE_LATENCY = REGISTRY.register(Histogram(
+    "uniquest_route_latency_seconds", "Latency of HTTP routes.", ["route", "status"]))
+EXTERNAL_CALLS = REGISTRY.register(Counter(
+    "uniquest_external_calls_total", "Calls to external services.", ["service", "target", "operation", "result"]))
+EXTERNAL_LATENCY = REGISTRY.register(Histogram(
+    "uniquest_external_call_latency_seconds", "Latency of calls to external services.",
+    ["service", "target", "operation"]))
+
+
+@contextmanager
+def track_external(service, target, operation):
+    """外部サービス呼び出しの件数・結果・レイテンシを記録する"""
+    started = time.perf_counter()
+    result = "ok"
+    try:
+        yield
+    except Exception as e:
+        result = type(e).__name__
+        raise
+    finally:
+        EXTERNAL_LATENCY.observe(time.perf_counter() - started, service=service, target=target, operation=operation)
+        EXTERNAL_CALLS.inc(service=service, target=target, operation=operation, result=result)
+
+
+class InstrumentedProxy:
+    """オブジェクトのメソッド呼び出しをすべて track_external で計測するラッパー"""
+
+    def __init__(self, wrapped, service, target=""):
+        self._wrapped = wrapped
+        self._service = service
+        self._target = target
+
+    def __getattr__(self, name):
+        attr = getattr(self._wrapped, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        def call(*args, **kwargs):
+            with track_external(self._service, self._target, name):
+                return attr(*args, **kwargs)
+        return call
+
+    @property
+    def wrapped(self):
+        return self._wrapped
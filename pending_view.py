@@ -0,0 +1,128 @@
+import threading
+from collections import deque
+from datetime import datetime
+from library import get_jst_date
+from planner import PLANNER_MAX_TASKS, plan_tasks
+
+
+def _today():
+    return datetime.strptime(get_jst_date(), "%Y-%m-%d").date()
+
+
+class PendingTaskView:
+    """未達成タスク（締切が今日以降かつ未記録）のマテリアライズドビュー
+
+    科目ごとに第◯回の若い順で保持し、達成記録の追加や日付の切り替わりでは
+    差分だけを反映する。「クエスト」と「合計」はどちらもこのビューを参照する。
+
+    completed_func() は達成済みの (科目キー, タイトルキー) のsetを、key_func(record) は
+    ミラーの行のキー（このビューの対象外の行なら None）を返す。
+    """
+
+    def __init__(self, catalog, mirror, completed_func, key_func):
+        self.catalog = catalog
+        self.mirror = mirror
+        self.completed_func = completed_func
+        self.key_func = key_func
+        self._lock = threading.Lock()
+        # 科目キー -> 未達成エントリ（第◯回・締切の昇順）
+        self._by_subject = {}
+        # (科目キー, タイトルキー) -> 未達成エントリ
+        self._by_key = {}
+        self._total = 0
+        self._today = None
+        self._catalog_version = None
+        self._mirror_generation = None
+        # ミラーから届いた達成キー（ミラーのロック内で積まれる）
+        self._completed_queue = deque()
+        mirror.add_listener(self._on_record)
+
+    def _on_record(self, record):
+        key = self.key_func(record)
+        if key is not None:
+            self._completed_queue.append(key)
+
+    def _rebuild(self, today):
+        self._completed_queue.clear()
+        version = self.catalog.version
+        completed = self.completed_func()
+        generation = self.mirror.generation
+
+        by_subject = {}
+        by_key = {}
+        total = 0
+        for entry in self.catalog.upcoming(today):
+            key = (entry.subject_key, entry.title_key)
+            if key in completed:
+                continue
+            by_subject.setdefault(entry.subject_key, []).append(entry)
+            by_key.setdefault(key, []).append(entry)
+            total += 1
+        for entries in by_subject.values():
+            entries.sort(key=lambda entry: (entry.lesson, entry.deadline))
+
+        self._by_subject = by_subject
+        self._by_key = by_key
+        self._total = total
+        self._today = today
+        self._catalog_version = version
+        self._mirror_generation = generation
+        print(f"📋 未達成タスクのビューを作成しました（{total}件）")
+
+    def _remove(self, key, entry=None):
+        entries = self._by_key.get(key)
+        if not entries:
+            return
+        targets = [entry] if entry is not None else list(entries)
+        for target in targets:
+            entries.remove(target)
+            subject_entries = self._by_subject[target.subject_key]
+            subject_entries.remove(target)
+            if not subject_entries:
+                del self._by_subject[target.subject_key]
+            self._total -= 1
+        if not entries:
+            del self._by_key[key]
+
+    def _roll_over(self, today):
+        # 締切が昨日までに過ぎたエントリだけを取り除く
+        entries = self.catalog.upcoming(self._today)
+        for entry in entries:
+            if entry.deadline >= today:
+                break
+            key = (entry.subject_key, entry.title_key)
+            if entry in self._by_key.get(key, ()):
+                self._remove(key, entry)
+        self._today = today
+
+    def _refresh(self):
+        # リモートで増えた達成記録はリスナー経由でキューに積まれる
+        self.mirror.refresh()
+        today = _today()
+        if (self._today is None or today < self._today
+                or self.catalog.version != self._catalog_version
+                or self.mirror.generation != self._mirror_generation):
+            self._rebuild(today)
+        elif today > self._today:
+            self._roll_over(today)
+
+        while self._completed_queue:
+            self._remove(self._completed_queue.popleft())
+
+    def heads(self):
+        """科目ごとの先頭（最も若い回）のエントリ"""
+        with self._lock:
+            self._refresh()
+            return [entries[0] for entries in self._by_subject.values()]
+
+    def plan(self, budget_hours, max_tasks=PLANNER_MAX_TASKS):
+        """学習時間の予算に収まる今日の計画（締切の近い順、科目内は回の順）"""
+        with self._lock:
+            self._refresh()
+            return plan_tasks(list(self._by_subject.values()), budget_hours, max_tasks)
+
+    def total(self):
+        """未達成タスクの総数"""
+        with self._lock:
+            self._refresh()
+            return self._total
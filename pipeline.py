@@ -0,0 +1,74 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from library import log_event
+from metrics import REGISTRY, Histogram
+
+# パイプラインの並列ステージを実行するスレッド数
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "8"))
+
+PIPELINE_STAGE_LATENCY = REGISTRY.register(Histogram(
+    "uniquest_pipeline_stage_seconds", "Latency of report and push pipeline stages.", ["pipeline", "stage"]))
+
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+
+
+class Pipeline:
+    """週次レポート・Push配信などの1回分の処理をステージに分けて計測する
+
+    依存するステージは stage() で順に、独立したステージは submit() / gather() で
+    並列に実行する。終了時にステージごとの所要時間と全体の時間をログに出す
+    （全体の時間は並列のステージの合計ではなく、一番遅いものに近くなる）。
+    並列のステージの中から、さらに submit() / gather() を呼ばないこと（スレッドを待ち合って止まる）。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._started = time.perf_counter()
+
+    def _record(self, stage, elapsed):
+        PIPELINE_STAGE_LATENCY.observe(elapsed, pipeline=self.name, stage=stage)
+        with self._lock:
+            self._timings[stage] = self._timings.get(stage, 0.0) + elapsed
+
+    @contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(stage, time.perf_counter() - started)
+
+    def submit(self, stage, func, *args, **kwargs):
+        """func をバックグラウンドで実行し、Future を返す"""
+        def run():
+            with self.stage(stage):
+                return func(*args, **kwargs)
+        return _executor.submit(run)
+
+    def gather(self, **stages):
+        """引数なしの関数をすべて並列に実行し、{ステージ名: 結果} を返す（例外はそのまま送出）"""
+        futures = {stage: self.submit(stage, func) for stage, func in stages.items()}
+        return {stage: future.result() for stage, future in futures.items()}
+
+    def timings(self):
+        with self._lock:
+            return {stage: round(elapsed * 1000, 1) for stage, elapsed in self._timings.items()}
+
+    def finish(self):
+        total = time.perf_counter() - self._started
+        PIPELINE_STAGE_LATENCY.observe(total, pipeline=self.name, stage="total")
+        timings = self.timings()
+        log_event("INFO", f"⏱️ {self.name} の所要時間", total_ms=round(total * 1000, 1), stages=timings)
+        return timings
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish()
+        return False
@@ -0,0 +1,108 @@
+import os
+import json
+import fcntl
+import heapq
+import threading
+from library import DEFAULT_USER_ID
+
+# 1日の学習時間（時間）の既定値と、ユーザーごとの設定の保存先
+PLANNER_DEFAULT_HOURS = float(os.getenv("PLANNER_DEFAULT_HOURS", "2"))
+PLANNER_BUDGETS_PATH = os.getenv("PLANNER_BUDGETS_PATH", "study_budgets.json")
+# 所要時間0のタスクばかりにならないよう、1日の計画に入れる最大件数
+PLANNER_MAX_TASKS = int(os.getenv("PLANNER_MAX_TASKS", "10"))
+
+
+def plan_tasks(subject_entries, budget_hours, max_tasks=PLANNER_MAX_TASKS):
+    """学習時間の予算内に収まるタスクを選ぶ
+
+    subject_entries は科目ごとの未達成エントリのリスト（第◯回の順）。各科目の先頭を
+    締切の近い順にヒープから取り出し、予算に収まれば計画に入れてその科目の次の回を
+    ヒープに積む。収まらなければその科目は打ち切る（回の順番を飛ばさない）。
+    科目数 S、選んだ件数 k に対して O(S + k log S) で、カタログ全体は走査しない。
+    """
+    heap = [
+        (entries[0].deadline, entries[0].lesson, subject_index, 0)
+        for subject_index, entries in enumerate(subject_entries) if entries
+    ]
+    heapq.heapify(heap)
+
+    remaining = budget_hours
+    plan = []
+    while heap and len(plan) < max_tasks:
+        _, _, subject_index, position = heapq.heappop(heap)
+        entries = subject_entries[subject_index]
+        entry = entries[position]
+        if entry.hours > remaining + 1e-9:
+            continue
+        plan.append(entry)
+        remaining -= entry.hours
+        if position + 1 < len(entries):
+            following = entries[position + 1]
+            heapq.heappush(heap, (following.deadline, following.lesson, subject_index, position + 1))
+    return plan
+
+
+class StudyBudgets:
+    """ユーザーごとの1日の学習時間（{"ユーザーID": 時間}）
+
+    複数のワーカープロセスから更新されるため、更新はファイルロックを取って
+    最新の内容を読み直してから行い、読み込み時も更新時刻が変わっていれば読み直す。
+    """
+
+    def __init__(self, path=PLANNER_BUDGETS_PATH, default_hours=PLANNER_DEFAULT_HOURS):
+        self.path = path
+        self.default_hours = default_hours
+        self._lock = threading.Lock()
+        self._budgets = {}
+        self._mtime = None
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._budgets = {}
+            self._mtime = None
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            self._budgets = {user_id: float(hours) for user_id, hours in json.load(f).items()}
+        self._mtime = mtime
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._budgets, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def get(self, user_id=DEFAULT_USER_ID):
+        with self._lock:
+            self._reload_if_changed()
+            return self._budgets.get(user_id, self.default_hours)
+
+    def set(self, user_id, hours):
+        hours = round(float(hours), 2)
+        if not 0 < hours <= 24:
+            raise ValueError("study hours must be between 0 and 24")
+        with self._lock, open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload_if_changed()
+                self._budgets[user_id] = hours
+                self._save()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return hours
+
+
+_budgets = None
+_budgets_lock = threading.Lock()
+
+
+def get_study_budgets():
+    global _budgets
+    with _budgets_lock:
+        if _budgets is None:
+            _budgets = StudyBudgets()
+        return _budgets
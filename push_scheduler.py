@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from linebot.exceptions import LineBotApiError
+from linebot.models import TextSendMessage
+from library import TokenBucket
+
+# multicastの宛先上限（LINE Messaging API）
+MULTICAST_LIMIT = 500
+PUSH_RATE_PER_SECOND = float(os.getenv("PUSH_RATE_PER_SECOND", "20"))
+PUSH_CONCURRENCY = int(os.getenv("PUSH_CONCURRENCY", "8"))
+PUSH_MAX_RETRIES = int(os.getenv("PUSH_MAX_RETRIES", "3"))
+# 送信済みの記録（同じ配信を再実行しても二重送信しない）
+PUSH_LEDGER_PATH = os.getenv("PUSH_LEDGER_PATH", "push_ledger.json")
+PUSH_LEDGER_KEEP = int(os.getenv("PUSH_LEDGER_KEEP", "200"))
+
+# 再送してもLINE側で重複とみなされる X-Line-Retry-Key の名前空間
+RETRY_KEY_NAMESPACE = uuid.UUID("6f0b4c1e-5d1a-4c55-9a43-3f1c2b7e8d90")
+
+
+class PushLedger:
+    """配信キーごとに送信済みのユーザーIDを記録する
+
+    スケジューラーのリーダーと手動のPushのエンドポイントなど、複数のプロセスから
+    使われるため、毎回ファイルロックを取って最新の内容を読み直す。
+    """
+
+    def __init__(self, path=PUSH_LEDGER_PATH, keep=PUSH_LEDGER_KEEP):
+        self.path = path
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @contextmanager
+    def _locked(self, exclusive):
+        with self._lock, open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def delivered(self, send_key):
+        with self._locked(exclusive=False):
+            return set(self._load().get(send_key, []))
+
+    def mark(self, send_key, user_ids):
+        with self._locked(exclusive=True):
+            sent = self._load()
+            users = sent.setdefault(send_key, [])
+            users.extend(user_id for user_id in user_ids if user_id not in users)
+            # 古い配信キーから捨てる（dictは挿入順）
+            while len(sent) > self.keep:
+                sent.pop(next(iter(sent)))
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(sent, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+def _retryable(e):
+    return e.status_code == 429 or e.status_code >= 500
+
+
+class PushScheduler:
+    """複数ユーザーへのPush配信
+
+    同じ文面はmulticast（最大500人ずつ）にまとめ、個別の文面は並列にpushする。
+    API呼び出しはトークンバケットで毎秒の件数を抑え、429/5xxは同じ
+    retry keyで再送するため、LINE側でも二重配信にならない。
+    """
+
+    def __init__(self, line_bot_api, rate=PUSH_RATE_PER_SECOND, concurrency=PUSH_CONCURRENCY,
+                 max_retries=PUSH_MAX_RETRIES, ledger=None):
+        self.line_bot_api = line_bot_api
+        self.bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.ledger = ledger or PushLedger()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="push")
+
+    def _plan(self, messages):
+        # 文面ごとに宛先をまとめる
+        by_text = {}
+        for user_id, text in messages.items():
+            by_text.setdefault(text, []).append(user_id)
+
+        jobs = []
+        for text, user_ids in by_text.items():
+            user_ids = sorted(user_ids)
+            if len(user_ids) == 1:
+                jobs.append((text, user_ids))
+                continue
+            for i in range(0, len(user_ids), MULTICAST_LIMIT):
+                jobs.append((text, user_ids[i:i + MULTICAST_LIMIT]))
+        return jobs
+
+    def _call(self, text, user_ids, retry_key):
+        message = TextSendMessage(text=text)
+        if len(user_ids) == 1:
+            self.line_bot_api.push_message(user_ids[0], message, retry_key=retry_key)
+        else:
+            self.line_bot_api.multicast(user_ids, message, retry_key=retry_key)
+
+    def _send_job(self, send_key, text, user_ids):
+        digest = hashlib.sha256(f"{text}\n{','.join(user_ids)}".encode("utf-8")).hexdigest()
+        retry_key = str(uuid.uuid5(RETRY_KEY_NAMESPACE, f"{send_key}:{digest}"))
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                self._call(text, user_ids, retry_key)
+                break
+            except LineBotApiError as e:
+                # 409はこのジョブのretry keyのリクエストが受理済み（LINEが受理したリクエストIDを返す）。
+                # 受理済みのIDがない409は別の原因なので、配信済みにせず失敗として扱う
+                if e.status_code == 409 and e.accepted_request_id:
+                    break
+                if not _retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = min(30, 2 ** attempt) * (0.5 + random.random())
+                print(f"⚠️ Push送信を再試行します（{e.status_code}、{delay:.1f}秒後）")
+                time.sleep(delay)
+
+        self.ledger.mark(send_key, user_ids)
+        return len(user_ids)
+
+    def send(self, messages, send_key):
+        """{ユーザーID: 文面} を配信する。send_key が同じ配信は送信済みの宛先を飛ばす"""
+        delivered = self.ledger.delivered(send_key)
+        pending = {user_id: text for user_id, text in messages.items() if user_id not in delivered}
+        jobs = self._plan(pending)
+
+        futures = [self._executor.submit(self._send_job, send_key, text, user_ids) for text, user_ids in jobs]
+        result = {"sent": 0, "skipped": len(messages) - len(pending), "failed": 0, "requests": len(jobs)}
+        for future, (text, user_ids) in zip(futures, jobs):
+            try:
+                result["sent"] += future.result()
+            except Exception as e:
+                result["failed"] += len(user_ids)
+                print(f"❌️ Push通知送信失敗（{len(user_ids)}人）：{e}")
+        print(f"📨 {send_key}: {result}")
+        return result
@@ -1,44 +1,20 @@
-from datetime import datetime, timedelta
-import gspread
-from google_sheets_util import get_sheet
-from library import get_jst_date, get_jst_time
+from sheet_mirror import get_completion_mirror, get_mirror
+from review_schedule import DEFAULT_REVIEW_DAYS, ReviewSchedule
+from library import get_jst_date, get_jst_time, DEFAULT_USER_ID
 
 # 忘却曲線のスケジュール
-REVIEW_DAYS = [1, 3, 7, 14, 30]
+REVIEW_DAYS = DEFAULT_REVIEW_DAYS
 
-# 復習対象を取得
-def get_review_targets():
-    sheet = get_sheet()
-    records = sheet.get_all_records()
-    today = datetime.now().date()
-    targets = []
-
-    for row in records:
-        try:
-            date_str = row.get("Date")
-            subject = row.get("Subject")
-            title = row.get("Title")
-
-            task_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-            days_since = (today - task_date).days
+# 復習予定のインデックス（達成記録・復習記録のミラーから更新）
+review_schedule = ReviewSchedule(get_completion_mirror(), get_mirror("復習記録"))
 
-            if days_since in REVIEW_DAYS:
-                targets.append({
-                    "date": date_str,
-                    "subject": subject,
-                    "title": title,
-                    "review_stage": REVIEW_DAYS.index(days_since) + 1
-                })
-        except Exception as e:
-            print(f"⚠️ 日付パースエラー: {row} - {e}")
-            continue
-
-    return targets
+# 復習対象を取得
+def get_review_targets(user_id=DEFAULT_USER_ID):
+    return review_schedule.due(user_id=user_id)
 
-def record_review_reminder(subject, title, stage):
+def record_review_reminder(subject, title, stage, user_id=DEFAULT_USER_ID):
     date = get_jst_date()
     timestamp = get_jst_time()
-    sheet = get_sheet("復習記録")
 
-    sheet.append_row([date, subject, title, stage, timestamp])
-    return True
\ No newline at end of file
+    get_mirror("復習記録").append_row([date, subject, title, stage, timestamp, user_id])
+    return True
@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import fcntl
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from library import get_jst_date, normalize, record_user_id, DEFAULT_USER_ID
+
+# 忘却曲線のスケジュール（既定値）
+DEFAULT_REVIEW_DAYS = [1, 3, 7, 14, 30]
+# ユーザーごとの復習間隔（{"ユーザーID": [1, 2, 4, ...]}）
+REVIEW_INTERVALS_PATH = os.getenv("REVIEW_INTERVALS_PATH", "review_intervals.json")
+
+
+def _parse_date(value):
+    return datetime.strptime(str(value).strip(), "%Y-%m-%d").date()
+
+def parse_stage(stage):
+    """「3回目」などの表記から復習の回数を取り出す"""
+    match = re.search(r"\d+", normalize(str(stage)))
+    return int(match.group()) if match else None
+
+
+class ReviewSchedule:
+    """復習予定を期日ごとのバケットで保持するインデックス
+
+    達成記録が追加されると +1, +3, +7... 日後のバケットに予定を積み、
+    🔁 の復習記録が追加されると対応する予定を取り除く。
+    「今日の復習対象」は当日のバケットを読むだけで求まる。
+    """
+
+    def __init__(self, completion_mirror, review_mirror, default_days=DEFAULT_REVIEW_DAYS,
+                 intervals_path=REVIEW_INTERVALS_PATH):
+        self.completion_mirror = completion_mirror
+        self.review_mirror = review_mirror
+        self.default_days = list(default_days)
+        self.intervals_path = intervals_path
+        self._lock = threading.Lock()
+        self._user_days = {}
+        self._intervals_mtime = None
+        # 期日 -> {予定キー: 予定}
+        self._buckets = {}
+        # (ユーザー, 科目キー, タイトルキー, 回数) -> {予定キー: 期日}
+        self._by_task = {}
+        self._built_for = None
+        self._today = None
+        # ミラーから届いた行（ミラーのロック内で積まれる）
+        self._events = deque()
+        completion_mirror.add_listener(lambda record: self._events.append(("completion", record)))
+        review_mirror.add_listener(lambda record: self._events.append(("review", record)))
+
+    # --- 復習間隔 ---
+
+    def _reload_intervals_if_changed(self):
+        """設定ファイルが（他のワーカーで）更新されていれば読み直し、変わったら True"""
+        try:
+            mtime = os.stat(self.intervals_path).st_mtime_ns
+        except FileNotFoundError:
+            changed = bool(self._user_days)
+            self._user_days = {}
+            self._intervals_mtime = None
+            return changed
+        if mtime == self._intervals_mtime:
+            return False
+        with open(self.intervals_path, "r", encoding="utf-8") as f:
+            user_days = {user_id: [int(day) for day in days] for user_id, days in json.load(f).items()}
+        changed = user_days != self._user_days
+        self._user_days = user_days
+        self._intervals_mtime = mtime
+        return changed
+
+    def _save_intervals(self):
+        tmp_path = f"{self.intervals_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._user_days, f, ensure_ascii=False)
+        os.replace(tmp_path, self.intervals_path)
+        self._intervals_mtime = os.stat(self.intervals_path).st_mtime_ns
+
+    def review_days(self, user_id=DEFAULT_USER_ID):
+        return self._user_days.get(user_id, self.default_days)
+
+    def set_user_intervals(self, user_id, days):
+        """ユーザーごとの復習間隔を設定する（次回参照時に予定を作り直す）"""
+        days = sorted({int(day) for day in days if int(day) > 0})
+        if not days:
+            raise ValueError("review days must not be empty")
+        with self._lock, open(f"{self.intervals_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload_intervals_if_changed()
+                self._user_days[user_id] = days
+                self._save_intervals()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            self._built_for = None
+        return days
+
+    # --- インデックスの更新 ---
+
+    def _add_completion(self, record):
+        try:
+            completed_on = _parse_date(record.get("Date"))
+        except ValueError:
+            return
+        user_id = record_user_id(record)
+        subject, title = record.get("Subject"), record.get("Title")
+        subject_key, title_key = normalize(subject), normalize(title)
+
+        for stage, days in enumerate(self.review_days(user_id), start=1):
+            due = completed_on + timedelta(days=days)
+            if due < self._today:
+                continue
+            key = (user_id, completed_on, subject_key, title_key, stage)
+            self._buckets.setdefault(due, {})[key] = {
+                "date": completed_on.strftime("%Y-%m-%d"),
+                "subject": subject,
+                "title": title,
+                "review_stage": stage,
+                "user_id": user_id,
+            }
+            self._by_task.setdefault(key[:1] + key[2:], {})[key] = due
+
+    def _add_review(self, record):
+        # 復習記録は [日付, 科目, タイトル, 回数, タイムスタンプ] の順
+        values = list(record.values())
+        if len(values) < 4:
+            return
+        user_id = record_user_id(record)
+        stage = parse_stage(values[3])
+        task_key = (user_id, normalize(values[1]), normalize(values[2]), stage)
+        pending = self._by_task.get(task_key)
+        if not pending:
+            return
+
+        # 最も期日の早い予定を復習済みとして取り除く
+        key = min(pending, key=pending.get)
+        due = pending.pop(key)
+        if not pending:
+            del self._by_task[task_key]
+        bucket = self._buckets.get(due)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._buckets[due]
+
+    def _rebuild(self, today):
+        self._events.clear()
+        completions = self.completion_mirror.get_all_records()
+        reviews = self.review_mirror.get_all_records()
+        generations = (self.completion_mirror.generation, self.review_mirror.generation)
+
+        self._buckets = {}
+        self._by_task = {}
+        self._today = today
+        for record in completions:
+            self._add_completion(record)
+        for record in reviews:
+            self._add_review(record)
+        self._built_for = generations
+
+        # 読み込み中に届いた行のうち、すでに反映したものは読み飛ばす
+        loaded = {id(record) for record in completions}
+        loaded.update(id(record) for record in reviews)
+        self._apply_events(skip=loaded)
+        print(f"🔁 復習予定のインデックスを作成しました（{len(self._buckets)}日分）")
+
+    def _apply_events(self, skip=()):
+        while self._events:
+            kind, record = self._events.popleft()
+            if id(record) in skip:
+                continue
+            if kind == "completion":
+                self._add_completion(record)
+            else:
+                self._add_review(record)
+
+    def _refresh(self, today):
+        self.completion_mirror.refresh()
+        self.review_mirror.refresh()
+        generations = (self.completion_mirror.generation, self.review_mirror.generation)
+        # 他のワーカーで復習間隔が変更されていれば予定を作り直す
+        if self._reload_intervals_if_changed():
+            self._built_for = None
+        if self._built_for != generations or self._today is None or today < self._today:
+            self._rebuild(today)
+            return
+
+        if today > self._today:
+            # 過ぎた期日のバケットを捨てる
+            for due in [due for due in self._buckets if due < today]:
+                for key in self._buckets.pop(due):
+                    task_key = key[:1] + key[2:]
+                    self._by_task.get(task_key, {}).pop(key, None)
+                    if not self._by_task.get(task_key):
+                        self._by_task.pop(task_key, None)
+            self._today = today
+
+        self._apply_events()
+
+    def due(self, today=None, user_id=DEFAULT_USER_ID):
+        """今日が期日の復習予定（未復習のもの）"""
+        today = today or _parse_date(get_jst_date())
+        with self._lock:
+            self._refresh(today)
+            return [
+                dict(entry) for entry in self._buckets.get(today, {}).values()
+                if entry["user_id"] == user_id
+            ]
@@ -0,0 +1,171 @@
+import os
+import fcntl
+import threading
+import time
+from datetime import datetime, timedelta
+from library import get_jst_date, get_jst_time
+
+# 1にするとアプリ内のスケジューラーで定時Pushを送る
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0") == "1"
+# 複数ワーカーのうち、このファイルのロックを取れた1プロセスだけが送信する
+SCHEDULER_LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", "/tmp/uniquest_scheduler.lock")
+# 送信の何分前に準備（シートの先読み・メッセージ作成）を始めるか
+SCHEDULER_WARMUP_MINUTES = int(os.getenv("SCHEDULER_WARMUP_MINUTES", "5"))
+SCHEDULER_TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", "15"))
+# 起動時、この分数以内に送信時刻を過ぎたジョブは取りこぼしとして実行する
+# （再デプロイ直後でも当日のPushを送る。送信済みの宛先はPushの送信記録で飛ばされる）
+SCHEDULER_CATCHUP_MINUTES = int(os.getenv("SCHEDULER_CATCHUP_MINUTES", "30"))
+
+WEEKDAYS = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
+
+
+def jst_now():
+    """JSTの現在時刻（タイムゾーンなし）"""
+    return datetime.strptime(get_jst_time(), "%Y-%m-%dT%H:%M:%S")
+
+def parse_schedule(spec):
+    """「07:00」（毎日）または「SUN 20:00」（毎週）を (曜日 or None, 時, 分) に変換"""
+    parts = spec.strip().upper().split()
+    weekday = None
+    if len(parts) == 2:
+        weekday = WEEKDAYS.index(parts[0][:3])
+    hour, minute = (int(value) for value in parts[-1].split(":"))
+    return weekday, hour, minute
+
+
+class ScheduledJob:
+    def __init__(self, name, spec, run, warmup=None):
+        self.name = name
+        self.spec = spec
+        self.weekday, self.hour, self.minute = parse_schedule(spec)
+        self.run = run
+        self.warmup = warmup
+        self.last_run = None
+        self.prepared_for = None
+        self.prepared = None
+
+    def next_run(self, now):
+        """now 以降で最も近い実行予定時刻（今日の分がまだなら今日）"""
+        candidate = now.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if self.weekday is not None:
+            candidate += timedelta(days=(self.weekday - candidate.weekday()) % 7)
+        if self.last_run is not None and candidate <= self.last_run:
+            candidate += timedelta(days=7 if self.weekday is not None else 1)
+        return candidate
+
+
+class Scheduler:
+    """JST基準のアプリ内スケジューラー
+
+    各ジョブは送信時刻の SCHEDULER_WARMUP_MINUTES 分前に warmup() で送信内容を作っておき、
+    時刻になったら run(prepared) で送るだけにする。gunicornの複数ワーカーで
+    二重送信しないよう、ロックファイルを取れたプロセスだけがジョブを実行する。
+    """
+
+    def __init__(self, lock_path=SCHEDULER_LOCK_PATH, warmup_minutes=SCHEDULER_WARMUP_MINUTES,
+                 tick=SCHEDULER_TICK_SECONDS, catchup_minutes=SCHEDULER_CATCHUP_MINUTES):
+        self.lock_path = lock_path
+        self.warmup = timedelta(minutes=warmup_minutes)
+        self.catchup = timedelta(minutes=catchup_minutes)
+        self.tick = tick
+        self.jobs = []
+        self._lock_file = None
+        self._thread = None
+
+    def add_job(self, name, spec, run, warmup=None):
+        job = ScheduledJob(name, spec, run, warmup)
+        self.jobs.append(job)
+        return job
+
+    def _try_become_leader(self):
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._lock_file = lock_file
+        print(f"⏰ スケジューラーのリーダーになりました（pid {os.getpid()}）")
+        return True
+
+    def start(self):
+        if self._thread is not None:
+            return
+        # 起動時刻より前の今日の分は実行済みとみなす（直前に過ぎた分は取りこぼしとして実行する）
+        now = jst_now()
+        for job in self.jobs:
+            due = job.next_run(now)
+            if due < now - self.catchup:
+                job.last_run = due
+            elif due <= now:
+                print(f"⏰ {job.name} の送信時刻（{due.strftime('%H:%M')}）を過ぎているため、起動後に実行します")
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                if self._try_become_leader():
+                    self.run_pending(jst_now())
+                else:
+                    self.skip_pending(jst_now())
+            except Exception as e:
+                print(f"❌️ スケジューラーでエラー: {e}")
+            time.sleep(self.tick)
+
+    def skip_pending(self, now):
+        # リーダー以外は時刻を過ぎたジョブを実行済みとして進めておく
+        for job in self.jobs:
+            due = job.next_run(now)
+            if due <= now:
+                job.last_run = due
+                job.prepared = None
+
+    def run_pending(self, now):
+        for job in self.jobs:
+            due = job.next_run(now)
+
+            if job.warmup is not None and job.prepared_for != due and due - self.warmup <= now:
+                started = time.monotonic()
+                try:
+                    job.prepared = job.warmup()
+                    job.prepared_for = due
+                    print(f"🔥 {job.name} の準備が完了しました（{time.monotonic() - started:.1f}秒）")
+                except Exception as e:
+                    print(f"❌️ {job.name} の準備に失敗: {e}")
+
+            if due <= now:
+                # 準備できていなければその場で作る
+                prepared = job.prepared if job.prepared_for == due else None
+                job.last_run = due
+                job.prepared = None
+                started = time.monotonic()
+                try:
+                    if prepared is None and job.warmup is not None:
+                        prepared = job.warmup()
+                    job.run(prepared)
+                    print(f"⏰ {job.name} を実行しました（{get_jst_date()}、{time.monotonic() - started:.1f}秒）")
+                except Exception as e:
+                    print(f"❌️ {job.name} の実行に失敗: {e}")
+
+    def status(self):
+        now = jst_now()
+        return {
+            "leader": self._lock_file is not None,
+            "jobs": [
+                {
+                    "name": job.name,
+                    "schedule": job.spec,
+                    "next_run": job.next_run(now).strftime("%Y-%m-%dT%H:%M"),
+                    "last_run": job.last_run.strftime("%Y-%m-%dT%H:%M") if job.last_run else None,
+                    "prepared": job.prepared_for is not None and job.prepared_for == job.next_run(now),
+                }
+                for job in self.jobs
+            ],
+        }
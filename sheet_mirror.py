@@ -0,0 +1,214 @@
+import os
+import re
+import time
+import threading
+from storage import get_sheet
+from write_buffer import buffered_append_row, pending_rows
+
+# リモートと同期する間隔（秒）
+MIRROR_TTL_SECONDS = float(os.getenv("SHEET_MIRROR_TTL", "60"))
+# 複数ユーザー対応後の行は最後の列にユーザーIDを書き込む
+USER_ID_HEADER = "UserId"
+
+
+def rowcol_to_a1(row, col):
+    """行・列番号をA1形式に変換（gspread.utils と同じ。gspreadを読み込まずに済ませる）"""
+    letters = ""
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return f"{letters}{row}"
+
+
+class SheetMirror:
+    """ワークシートのプロセス内ミラー
+
+    初回に全件を読み込み、以降は自分の追記をローカルにも反映（write-through）しつつ、
+    TTLごとにリモートで増えた行だけを取得する。
+    """
+
+    def __init__(self, sheet_name, ttl=MIRROR_TTL_SECONDS):
+        self.sheet_name = sheet_name
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._header = None
+        self._records = []
+        # リモートに存在が確認できているデータ行数（ヘッダー除く）
+        self._remote_rows = 0
+        # 追記済みだがリモートでまだ確認していない自分の行
+        self._pending = []
+        self._synced_at = None
+        # 名前 -> (キー関数, {キー: 件数})
+        self._indexes = {}
+        # 行が追加されたときに呼ぶ関数
+        self._listeners = []
+        # 全件を読み直すたびに増える世代番号
+        self.generation = 0
+
+    def _row_to_record(self, values):
+        values = list(values) + [""] * (len(self._header) - len(values))
+        return dict(zip(self._header, values))
+
+    def _row_signature(self, values):
+        values = [str(v) for v in values][:len(self._header)]
+        values += [""] * (len(self._header) - len(values))
+        return values
+
+    def _load(self):
+        sheet = get_sheet(self.sheet_name)
+        rows = sheet.get_all_values()
+        self._header = rows[0] if rows else []
+        if self._header and USER_ID_HEADER not in self._header:
+            # ヘッダーがないと最後の列（ユーザーID）が捨てられ、全員の行が既定のユーザーの
+            # ものとして扱われる（重複チェックもユーザーごとに効かなくなる）
+            print(f"⚠️ {self.sheet_name} の1行目に {USER_ID_HEADER} 列のヘッダーがありません。"
+                  f"最後の列をユーザーIDとして読み込みます。シートの{rowcol_to_a1(1, len(self._header) + 1)}に"
+                  f"「{USER_ID_HEADER}」を追加してください")
+            self._header = self._header + [USER_ID_HEADER]
+        self._records = [self._row_to_record(row) for row in rows[1:]]
+        self._remote_rows = len(rows) - 1 if rows else 0
+        self._pending = []
+        self._synced_at = time.monotonic()
+        self.generation += 1
+        for name in self._indexes:
+            self._rebuild_index(name)
+        # まだSheetsに書き込まれていないバッファ内の行も反映する
+        for row in pending_rows(self.sheet_name):
+            self._apply_local(row)
+        print(f"🪞 {self.sheet_name} を読み込みました（{self._remote_rows}行）")
+
+    def _sync(self):
+        # 最後に確認した行より後ろだけを取得する
+        sheet = get_sheet(self.sheet_name)
+        start = rowcol_to_a1(self._remote_rows + 2, 1)
+        end_column = re.sub(r"\d+", "", rowcol_to_a1(1, max(len(self._header), 1)))
+        rows = sheet.get_values(f"{start}:{end_column}")
+        # 新しい行がなくても gspread は [[]] を返す。末尾の空行は実在する行として数えない
+        # （途中の空行は実在するので数える）
+        while rows and not any(str(v) for v in rows[-1]):
+            rows = rows[:-1]
+
+        for row in rows:
+            self._remote_rows += 1
+            if not any(str(v) for v in row):
+                continue
+            # 自分が追記した行はすでにローカルに反映済み
+            if self._pending and self._row_signature(row) == self._pending[0]:
+                self._pending.pop(0)
+                continue
+            self._add_record(self._row_to_record(row))
+        self._synced_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._header is None:
+            self._load()
+        elif time.monotonic() - self._synced_at >= self.ttl:
+            try:
+                self._sync()
+            except Exception as e:
+                # クォータ超過などで同期できなくても、手元の内容で応答する（次のTTLで再試行）
+                print(f"⚠️ {self.sheet_name} の同期に失敗したため前回の内容を使います: {e}")
+                self._synced_at = time.monotonic()
+
+    def refresh(self):
+        """TTLを過ぎていればリモートと同期する"""
+        with self._lock:
+            self._ensure_fresh()
+
+    def get_all_records(self):
+        """全レコード（ヘッダーをキーにしたdict）のコピーを返す"""
+        with self._lock:
+            self._ensure_fresh()
+            return list(self._records)
+
+    def append_row(self, row_values):
+        """リモートに追記し、同じ行をローカルにも反映する"""
+        with self._lock:
+            self._ensure_fresh()
+            buffered_append_row(self.sheet_name, row_values)
+            self._apply_local(row_values)
+
+    def _apply_local(self, row_values):
+        self._add_record(self._row_to_record([str(v) for v in row_values]))
+        self._pending.append(self._row_signature(row_values))
+
+    def _add_record(self, record):
+        self._records.append(record)
+        for key_func, index in self._indexes.values():
+            key = key_func(record)
+            index[key] = index.get(key, 0) + 1
+        for listener in self._listeners:
+            listener(record)
+
+    def _rebuild_index(self, name):
+        key_func, _ = self._indexes[name]
+        index = {}
+        for record in self._records:
+            key = key_func(record)
+            index[key] = index.get(key, 0) + 1
+        self._indexes[name] = (key_func, index)
+
+    def add_index(self, name, key_func):
+        """レコードから計算したキーのハッシュインデックスを登録する
+
+        インデックスは読み込み・同期・追記のたびに差分で更新される。
+        """
+        with self._lock:
+            self._indexes[name] = (key_func, {})
+            if self._header is not None:
+                self._rebuild_index(name)
+
+    def add_listener(self, listener):
+        """行の追加（同期・追記）ごとに listener(record) を呼ぶ
+
+        全件の読み直しでは呼ばれないので、generation の変化で検知すること。
+        リスナーはミラーのロック内で呼ばれるため、他のロックを取らないこと。
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def contains(self, name, key):
+        """インデックスにキーが存在するか（O(1)）"""
+        with self._lock:
+            self._ensure_fresh()
+            return key in self._indexes[name][1]
+
+    def index_keys(self, name):
+        """インデックスのキー一覧をsetで返す"""
+        with self._lock:
+            self._ensure_fresh()
+            return set(self._indexes[name][1])
+
+    def invalidate(self):
+        """ミラーを破棄し、次回アクセス時に全件を読み直す"""
+        with self._lock:
+            self._header = None
+            self._records = []
+            self._remote_rows = 0
+            self._pending = []
+            self._synced_at = None
+            self.generation += 1
+            for name, (key_func, _) in self._indexes.items():
+                self._indexes[name] = (key_func, {})
+
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_mirror(sheet_name="達成記録"):
+    with _mirrors_lock:
+        mirror = _mirrors.get(sheet_name)
+        if mirror is None:
+            mirror = SheetMirror(sheet_name)
+            _mirrors[sheet_name] = mirror
+        return mirror
+
+def get_completion_mirror():
+    return get_mirror("達成記録")
+
+def invalidate_mirrors():
+    with _mirrors_lock:
+        mirrors = list(_mirrors.values())
+    for mirror in mirrors:
+        mirror.invalidate()
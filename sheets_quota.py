@@ -0,0 +1,204 @@
+import os
+import sys
+import copy
+import time
+import random
+import threading
+from collections import deque
+from library import TokenBucket
+
+# Sheets APIの1分あたりの上限（ユーザー・プロジェクトごとの既定値は読み書きとも60回/分）
+SHEETS_READS_PER_MINUTE = int(os.getenv("SHEETS_READS_PER_MINUTE", "60"))
+SHEETS_WRITES_PER_MINUTE = int(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+# 一度に使ってよい回数（バースト）
+SHEETS_QUOTA_BURST = int(os.getenv("SHEETS_QUOTA_BURST", "10"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+SHEETS_BACKOFF_BASE = float(os.getenv("SHEETS_BACKOFF_BASE", "1.0"))
+SHEETS_BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", "32"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# ワークシートの読み取り系メソッド（同じ引数の同時呼び出しは1回にまとめる）
+READ_METHODS = {
+    "get_all_values", "get_all_records", "get_values", "get", "batch_get",
+    "row_values", "col_values", "acell", "cell", "find", "findall",
+}
+
+
+def _status_code(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+def _is_api_error(error):
+    # gspreadはクライアントを作るときに初めて読み込まれる（読み込まれていなければAPIErrorも起きない）
+    exceptions = sys.modules.get("gspread.exceptions")
+    return exceptions is not None and isinstance(error, exceptions.APIError)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SheetsQuotaGuard:
+    """Sheets APIの呼び出しをクォータ内に収める
+
+    - 同じワークシート・メソッド・引数の読み取りが同時に来たら、1回だけ呼んで結果を共有する
+    - 読み取り・書き込みそれぞれをトークンバケットで1分あたりの上限以下に抑える
+    - 429/5xx はジッター付きの指数バックオフで再試行する
+      （書き込みは二重追記を避けるため、確実に処理されていない429のみ再試行）
+    """
+
+    def __init__(self, reads_per_minute=SHEETS_READS_PER_MINUTE, writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+                 burst=SHEETS_QUOTA_BURST, max_retries=SHEETS_MAX_RETRIES,
+                 backoff_base=SHEETS_BACKOFF_BASE, backoff_max=SHEETS_BACKOFF_MAX):
+        self.buckets = {
+            "read": TokenBucket(reads_per_minute / 60.0, min(burst, reads_per_minute)),
+            "write": TokenBucket(writes_per_minute / 60.0, min(burst, writes_per_minute)),
+        }
+        self.limits = {"read": reads_per_minute, "write": writes_per_minute}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._flights = {}
+        # 直近1分間に送ったリクエストの時刻（種類ごと）
+        self._recent = {"read": deque(), "write": deque()}
+        self._stats = {
+            "read_requests": 0,
+            "write_requests": 0,
+            "coalesced": 0,
+            "throttled": 0,
+            "throttled_wait_seconds": 0.0,
+            "retries": 0,
+            "quota_errors": 0,
+            "server_errors": 0,
+            "failures": 0,
+        }
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record_request(self, kind):
+        now = time.monotonic()
+        with self._lock:
+            self._stats[f"{kind}_requests"] += 1
+            recent = self._recent[kind]
+            recent.append(now)
+            while recent and now - recent[0] > 60:
+                recent.popleft()
+
+    def execute(self, kind, func, *args, **kwargs):
+        """トークンを取ってから func を呼び、429/5xx なら再試行する"""
+        attempt = 0
+        while True:
+            waited = self.buckets[kind].acquire()
+            if waited:
+                with self._lock:
+                    self._stats["throttled"] += 1
+                    self._stats["throttled_wait_seconds"] += waited
+            self._record_request(kind)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not _is_api_error(e):
+                    raise
+                status = _status_code(e)
+                with self._lock:
+                    if status == 429:
+                        self._stats["quota_errors"] += 1
+                    elif status in RETRYABLE_STATUS:
+                        self._stats["server_errors"] += 1
+                retryable = status == 429 or (kind == "read" and status in RETRYABLE_STATUS)
+                if not retryable or attempt >= self.max_retries:
+                    with self._lock:
+                        self._stats["failures"] += 1
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                with self._lock:
+                    self._stats["retries"] += 1
+                print(f"⚠️ Sheets APIが{status}を返したため{delay:.1f}秒後に再試行します（{attempt}回目）")
+                time.sleep(delay)
+
+    def read(self, key, func, *args, **kwargs):
+        """同じ key の読み取りが進行中ならその結果を待って共有する"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # 呼び出し側が結果を書き換えても他に影響しないようにコピーを返す
+            return copy.deepcopy(flight.result)
+
+        result = None
+        try:
+            result = self.execute("read", func, *args, **kwargs)
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                waiters = flight.waiters
+            # 待っている呼び出しには、呼び出し元が書き換える前の結果を渡す
+            if waiters and flight.error is None:
+                flight.result = copy.deepcopy(result)
+            flight.done.set()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            for kind, recent in self._recent.items():
+                while recent and now - recent[0] > 60:
+                    recent.popleft()
+                stats[f"{kind}s_last_minute"] = len(recent)
+                stats[f"{kind}_limit_per_minute"] = self.limits[kind]
+            stats["in_flight"] = len(self._flights)
+        for kind, bucket in self.buckets.items():
+            stats[f"{kind}_tokens_available"] = round(bucket.available(), 2)
+        stats["throttled_wait_seconds"] = round(stats["throttled_wait_seconds"], 3)
+        return stats
+
+
+class GuardedWorksheet:
+    """ワークシートの呼び出しを SheetsQuotaGuard 経由にするラッパー"""
+
+    def __init__(self, worksheet, guard, sheet_name):
+        self._worksheet = worksheet
+        self._guard = guard
+        self._sheet_name = sheet_name
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        if name in READ_METHODS:
+            def call(*args, **kwargs):
+                key = (self._sheet_name, name, repr(args), repr(sorted(kwargs.items())))
+                return self._guard.read(key, attr, *args, **kwargs)
+        else:
+            def call(*args, **kwargs):
+                return self._guard.execute("write", attr, *args, **kwargs)
+        return call
+
+
+_guard = SheetsQuotaGuard()
+
+
+def get_quota_guard():
+    return _guard
@@ -0,0 +1,260 @@
+"""記録の保存先（Google Sheets / SQLite）
+
+STORAGE_BACKEND=sheets（既定）なら従来どおりGoogle Sheetsを直接読み書きする。
+STORAGE_BACKEND=sqlite にするとローカルのSQLiteに保存し、追記された行は
+バックグラウンドでUniQuest_DBのシートへ書き出す（シートは閲覧用の写しになる）。
+既存のシートからの取り込みは
+
+    python storage.py import
+"""
+import os
+import re
+import sys
+import fcntl
+import sqlite3
+import threading
+import google_sheets_util
+from metrics import InstrumentedProxy
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "uniquest.db")
+# シートへの書き出しの間隔（秒）と1回あたりの最大行数
+STORAGE_EXPORT_INTERVAL = float(os.getenv("STORAGE_EXPORT_INTERVAL", "10"))
+STORAGE_EXPORT_BATCH_SIZE = int(os.getenv("STORAGE_EXPORT_BATCH_SIZE", "200"))
+
+# シート名 -> (テーブル名, [(シートの見出し, 列名)], インデックス)
+TABLES = {
+    "達成記録": ("completions", [
+        ("Date", "date"), ("Subject", "subject"), ("Title", "title"),
+        ("Timestamp", "timestamp"), ("UserId", "user_id"),
+    ], [("user_id", "date"), ("user_id", "subject", "title")]),
+    "感情ログ": ("emotion_logs", [
+        ("today", "date"), ("感情", "emotion"), ("集中度", "focus"),
+        ("コメント", "comment"), ("UserId", "user_id"),
+    ], [("user_id", "date")]),
+    "復習記録": ("reviews", [
+        ("Date", "date"), ("Subject", "subject"), ("Title", "title"),
+        ("Stage", "stage"), ("Timestamp", "timestamp"), ("UserId", "user_id"),
+    ], [("user_id", "date"), ("user_id", "subject", "title", "stage")]),
+    "週次レポート": ("weekly_reports", [
+        ("週", "week"), ("理想達成数", "ideal_count"), ("実達成数", "actual_count"),
+        ("達成率", "achievement_rate"), ("平均集中度", "average_focus"),
+        ("感情傾向", "emotion_trend"), ("コメント", "comment"), ("UserId", "user_id"),
+    ], [("user_id", "week")]),
+}
+
+
+class SQLiteWorksheet:
+    """SQLiteのテーブルをgspreadのワークシートと同じ呼び方で扱う"""
+
+    def __init__(self, storage, sheet_name):
+        self.storage = storage
+        self.title = sheet_name
+        self.table, columns, _ = TABLES[sheet_name]
+        self.header = [header for header, _ in columns]
+        self.columns = [column for _, column in columns]
+
+    def _select(self, offset=0):
+        sql = f"SELECT {', '.join(self.columns)} FROM {self.table} ORDER BY id LIMIT -1 OFFSET ?"
+        return [list(row) for row in self.storage.connection().execute(sql, (offset,))]
+
+    def get_all_values(self):
+        return [list(self.header)] + self._select()
+
+    def get_all_records(self):
+        return [dict(zip(self.header, row)) for row in self._select()]
+
+    def get_values(self, range_name):
+        # 「A10:E」形式の範囲の開始行（1行目は見出し）から後ろを返す
+        start = int(re.match(r"[A-Z]+(\d+)", range_name).group(1))
+        return self._select(max(start - 2, 0))
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values])
+
+    def append_rows(self, rows, exported=False, **kwargs):
+        placeholders = ", ".join("?" for _ in self.columns)
+        sql = f"INSERT INTO {self.table} ({', '.join(self.columns)}, exported) VALUES ({placeholders}, ?)"
+        values = []
+        for row in rows:
+            row = [str(v) for v in row][:len(self.columns)]
+            values.append(row + [""] * (len(self.columns) - len(row)) + [1 if exported else 0])
+        with self.storage.connection() as conn:
+            conn.executemany(sql, values)
+        if not exported:
+            self.storage.notify_exporter()
+
+
+class SQLiteStorage:
+    """SQLiteへの保存と、シートへの非同期の書き出し
+
+    接続はスレッドごとに作る。gunicornの複数ワーカーから同じファイルを使うため
+    WALモードにし、書き出しはロックファイルを取れた1プロセスだけが行う。
+    """
+
+    def __init__(self, path=SQLITE_PATH, export_interval=STORAGE_EXPORT_INTERVAL,
+                 export_batch_size=STORAGE_EXPORT_BATCH_SIZE):
+        self.path = path
+        self.export_interval = export_interval
+        self.export_batch_size = export_batch_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._worksheets = {}
+        self._create_tables()
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self):
+        with self.connection() as conn:
+            for table, columns, indexes in TABLES.values():
+                column_defs = ", ".join(f"{column} TEXT NOT NULL DEFAULT ''" for _, column in columns)
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    f"id INTEGER PRIMARY KEY AUTOINCREMENT, {column_defs}, exported INTEGER NOT NULL DEFAULT 0)"
+                )
+                for index_columns in indexes:
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(index_columns)} "
+                        f"ON {table} ({', '.join(index_columns)})"
+                    )
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_exported ON {table} (exported, id)")
+
+    def reset_connections(self):
+        """fork後の子プロセスで、親から引き継いだ接続を使わないようにする"""
+        self._local = threading.local()
+
+    def get_worksheet(self, sheet_name):
+        with self._lock:
+            worksheet = self._worksheets.get(sheet_name)
+            if worksheet is None:
+                worksheet = InstrumentedProxy(SQLiteWorksheet(self, sheet_name), "sqlite", sheet_name)
+                self._worksheets[sheet_name] = worksheet
+            return worksheet
+
+    def row_count(self, sheet_name):
+        table = TABLES[sheet_name][0]
+        return self.connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    # --- シートへの書き出し ---
+
+    def unexported_count(self):
+        conn = self.connection()
+        return sum(
+            conn.execute(f"SELECT COUNT(*) FROM {table} WHERE exported = 0").fetchone()[0]
+            for table, _, _ in TABLES.values()
+        )
+
+    def export_pending(self):
+        """まだシートにない行をシートごとに append_rows で書き出す"""
+        conn = self.connection()
+        exported = 0
+        for sheet_name, (table, columns, _) in TABLES.items():
+            names = ", ".join(column for _, column in columns)
+            rows = conn.execute(
+                f"SELECT id, {names} FROM {table} WHERE exported = 0 ORDER BY id LIMIT ?",
+                (self.export_batch_size,),
+            ).fetchall()
+            if not rows:
+                continue
+            try:
+                google_sheets_util.get_sheet(sheet_name).append_rows([list(row[1:]) for row in rows])
+            except Exception as e:
+                # 書き出せなかった行は次回に再送する
+                print(f"❌️ {sheet_name} への書き出しに失敗: {e}")
+                continue
+            with conn:
+                conn.executemany(f"UPDATE {table} SET exported = 1 WHERE id = ?", [(row[0],) for row in rows])
+            exported += len(rows)
+        if exported:
+            print(f"✅️ シートへ{exported}行を書き出しました")
+        return exported
+
+    def notify_exporter(self):
+        self._wakeup.set()
+
+    def start_exporter(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run_exporter, name="sqlite-exporter", daemon=True)
+            self._thread.start()
+
+    def _run_exporter(self):
+        lock_file = open(f"{self.path}.export.lock", "a+")
+        leader = False
+        while True:
+            self._wakeup.wait(self.export_interval)
+            self._wakeup.clear()
+            try:
+                if not leader:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        leader = True
+                    except BlockingIOError:
+                        continue
+                # 書き出しが追いつくまで続ける
+                while self.export_pending() >= self.export_batch_size:
+                    pass
+            except Exception as e:
+                print(f"❌️ シートへの書き出し中にエラー: {e}")
+
+    # --- シートからの取り込み ---
+
+    def import_from_sheets(self, force=False):
+        """既存のシートの行を取り込む（取り込んだ行は書き出し済みとして扱う）"""
+        imported = {}
+        for sheet_name in TABLES:
+            if self.row_count(sheet_name) and not force:
+                print(f"⚠️ {sheet_name} はすでにデータがあるため取り込みません（--force で追加取り込み）")
+                continue
+            rows = google_sheets_util.get_sheet(sheet_name).get_all_values()[1:]
+            rows = [row for row in rows if any(str(v) for v in row)]
+            SQLiteWorksheet(self, sheet_name).append_rows(rows, exported=True)
+            imported[sheet_name] = len(rows)
+            print(f"📥 {sheet_name} から{len(rows)}行を取り込みました")
+        return imported
+
+
+_sqlite_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_sqlite_storage():
+    global _sqlite_storage
+    with _storage_lock:
+        if _sqlite_storage is None:
+            _sqlite_storage = SQLiteStorage()
+        return _sqlite_storage
+
+def start_exporter():
+    if STORAGE_BACKEND == "sqlite":
+        get_sqlite_storage().start_exporter()
+
+# google_sheets_util と同じ呼び方で、設定された保存先のワークシートを返す
+def get_sheet(sheet_name="達成記録"):
+    if STORAGE_BACKEND == "sqlite":
+        return get_sqlite_storage().get_worksheet(sheet_name)
+    return google_sheets_util.get_sheet(sheet_name)
+
+def get_emotion_sheet():
+    return get_sheet("感情ログ")
+
+def append_row_to_sheet(sheet_name, row_values):
+    get_sheet(sheet_name).append_row(row_values)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["import"]:
+        get_sqlite_storage().import_from_sheets(force="--force" in sys.argv[2:])
+    else:
+        print("usage: python storage.py import [--force]")
+        sys.exit(1)
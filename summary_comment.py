@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from library import debug_log
+from metrics import track_external
+
+# コメント生成のバックエンド（openai / stub）
+SUMMARY_COMMENT_BACKEND = os.getenv("SUMMARY_COMMENT_BACKEND", "openai")
+SUMMARY_COMMENT_MODEL = os.getenv("SUMMARY_COMMENT_MODEL", "gpt-4o")
+# この秒数を過ぎたらテンプレートのコメントで代用する
+SUMMARY_COMMENT_TIMEOUT = float(os.getenv("SUMMARY_COMMENT_TIMEOUT", "8"))
+SUMMARY_COMMENT_CACHE_SIZE = int(os.getenv("SUMMARY_COMMENT_CACHE_SIZE", "64"))
+# 同時に生成するコメントの数（全ユーザーの週次レポートをまとめて作るとき）
+SUMMARY_COMMENT_CONCURRENCY = int(os.getenv("SUMMARY_COMMENT_CONCURRENCY", "4"))
+
+SYSTEM_PROMPT = "あなたは学習支援アシスタントです。。"
+
+
+def build_prompt(summary_data):
+    return (
+        f"以下は、ある学生の1週間の学習活動のサマリーです：\n"
+        f"- 週の期間：{summary_data['週']}\n"
+        f"- 理想達成数：{summary_data['理想達成数']}件\n"
+        f"- 実達成数：{summary_data['実達成数']}件\n"
+        f"- 達成率：{summary_data['達成率']}\n"
+        f"- 平均集中度：{summary_data['平均集中度']}\n"
+        f"- 感情傾向：{summary_data['感情傾向']}\n\n"
+        f"このデータをもとに、学生に向けてポジティブで具体的な振り返りコメントを100文字以内で書いてください。"
+    )
+
+# AIが使えないときの定型コメント（同じ入力には同じコメント）
+def fallback_comment(summary_data):
+    actual = summary_data.get("実達成数", 0)
+    rate = summary_data.get("達成率", "0%")
+    if not actual:
+        return "今週は記録がありませんでした。来週は1日1件から、無理なく再スタートしましょう！"
+    if int(str(rate).replace("%", "") or 0) >= 100:
+        return f"今週は{actual}件を達成し、達成率{rate}！理想を超えるペースです。この調子で続けましょう！"
+    return f"今週は{actual}件を達成（達成率{rate}）。積み重ねができています。来週はもう1件を目標にしてみましょう！"
+
+def summary_key(summary_data):
+    payload = json.dumps(summary_data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class OpenAICommentBackend:
+    """OpenAIでコメントを生成する（クライアントは初回使用時に作成）"""
+
+    def __init__(self, model=SUMMARY_COMMENT_MODEL):
+        self.model = model
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI()
+            return self._client
+
+    def generate(self, prompt, timeout):
+        client = self._get_client()
+        with track_external("openai", self.model, "chat.completions.create"):
+            response = client.chat.completions.create(
+                model = self.model,
+                messages = [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                timeout = timeout,
+            )
+        return response.choices[0].message.content.strip()
+
+
+class StubCommentBackend:
+    """テスト・ベンチマーク用のローカルバックエンド（外部通信なし）"""
+
+    def __init__(self, delay=0.0, reply=None):
+        self.delay = delay
+        self.reply = reply
+        self.calls = 0
+
+    def generate(self, prompt, timeout):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self.reply or f"（スタブ）{len(prompt)}文字のサマリーを受け取りました。今週もよく頑張りました！"
+
+
+BACKENDS = {
+    "openai": OpenAICommentBackend,
+    "stub": StubCommentBackend,
+}
+
+
+class SummaryCommentService:
+    """サマリーのハッシュをキーにコメントをキャッシュする
+
+    生成は別スレッドで行い、締め切りまでに返らなければ定型コメントを返す。
+    間に合わなかった生成も完了すればキャッシュされ、次回以降に使われる。
+    """
+
+    def __init__(self, backend, timeout=SUMMARY_COMMENT_TIMEOUT, cache_size=SUMMARY_COMMENT_CACHE_SIZE,
+                 concurrency=SUMMARY_COMMENT_CONCURRENCY):
+        self.backend = backend
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="summary-comment")
+
+    def _generate(self, key, summary_data):
+        try:
+            comment = self.backend.generate(build_prompt(summary_data), self.timeout)
+            debug_log(f"総括コメント: {comment}")
+            with self._lock:
+                self._cache[key] = comment
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return comment
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _submit(self, key, summary_data):
+        # 同じサマリーの生成が進行中ならそれを待つ
+        with self._lock:
+            if key in self._cache:
+                return None
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._generate, key, summary_data)
+                self._inflight[key] = future
+            return future
+
+    def cached(self, summary_data):
+        with self._lock:
+            return self._cache.get(summary_key(summary_data))
+
+    def precompute(self, summary_data):
+        """Push前にコメント生成を始めておく"""
+        return self._submit(summary_key(summary_data), summary_data)
+
+    def get_comment(self, summary_data, timeout=None):
+        key = summary_key(summary_data)
+        future = self._submit(key, summary_data)
+        if future is None:
+            return self.cached(summary_data) or fallback_comment(summary_data)
+
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            print("⚠️ 総括コメントの生成が間に合わなかったため定型コメントを使います")
+        except Exception as e:
+            print(f"❌️ 総括コメントの生成に失敗: {e}")
+        return fallback_comment(summary_data)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_comment_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SummaryCommentService(BACKENDS[SUMMARY_COMMENT_BACKEND]())
+        return _service
+
+def set_comment_backend(backend):
+    """バックエンドを差し替える（テスト・ベンチマーク用）"""
+    global _service
+    with _service_lock:
+        _service = SummaryCommentService(backend)
+        return _service
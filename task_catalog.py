@@ -0,0 +1,114 @@
+import os
+import bisect
+import threading
+from collections import namedtuple
+from library import load_tasks, normalize, parse_deadline, extract_lesson_number
+
+TASKS_PATH = os.getenv("TASKS_PATH", "tasks.json")
+# ユーザー専用のタスク一覧（<ユーザーID>.json があればそちらを使う）
+USER_TASKS_DIR = os.getenv("USER_TASKS_DIR", "user_tasks")
+
+# コンパイル済みのタスク（task は tasks.json の元のdict）
+CatalogEntry = namedtuple(
+    "CatalogEntry",
+    ["task", "subject", "title", "subject_key", "title_key", "deadline", "lesson", "hours"],
+)
+
+
+def _parse_hours(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class TaskCatalog:
+    """tasks.json をパース済みの形で保持するカタログ
+
+    締切・正規化キー・第◯回の番号・所要時間を起動時に一度だけ計算し、
+    ファイルの更新時刻が変わったときだけ読み直す。
+    エントリは締切順に並べてあり、締切での絞り込みは二分探索で行う。
+    """
+
+    def __init__(self, path=TASKS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._tasks = []
+        # (締切順のエントリ, 締切のリスト) を入れ替えで更新する
+        self._compiled = ([], [])
+
+    def _compile(self, tasks):
+        entries = []
+        for task in tasks:
+            try:
+                entries.append(CatalogEntry(
+                    task=task,
+                    subject=task["subject"],
+                    title=task["title"],
+                    subject_key=normalize(task["subject"]),
+                    title_key=normalize(task["title"]),
+                    deadline=parse_deadline(task["deadline"]),
+                    lesson=extract_lesson_number(task["title"]),
+                    hours=_parse_hours(task.get("estimated_time_hours")),
+                ))
+            except Exception as e:
+                print(f"❌️ タスクの読み込み中にエラー: {task} - {e}")
+                continue
+        entries.sort(key=lambda entry: entry.deadline)
+        return entries
+
+    def _reload_if_changed(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            tasks = load_tasks(self.path)
+            entries = self._compile(tasks)
+            self._tasks = tasks
+            self._compiled = (entries, [entry.deadline for entry in entries])
+            self._mtime = mtime
+            print(f"📚️ タスクカタログを読み込みました（{len(entries)}件）")
+
+    def tasks(self):
+        """tasks.json の内容（元の順序のdictのリスト）"""
+        self._reload_if_changed()
+        return list(self._tasks)
+
+    def entries(self):
+        """全エントリ（締切順）"""
+        self._reload_if_changed()
+        return self._compiled[0]
+
+    def upcoming(self, today):
+        """締切が today 以降のエントリ（締切順）"""
+        self._reload_if_changed()
+        entries, deadlines = self._compiled
+        return entries[bisect.bisect_left(deadlines, today):]
+
+    @property
+    def version(self):
+        """再読み込みのたびに変わる値（派生データの作り直し判定用）"""
+        self._reload_if_changed()
+        return self._mtime
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(user_id=None):
+    path = TASKS_PATH
+    if user_id:
+        user_path = os.path.join(USER_TASKS_DIR, f"{user_id}.json")
+        if os.path.exists(user_path):
+            path = user_path
+
+    with _catalogs_lock:
+        catalog = _catalogs.get(path)
+        if catalog is None:
+            catalog = TaskCatalog(path)
+            _catalogs[path] = catalog
+        return catalog
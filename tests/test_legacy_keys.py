@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from task_catalog import TaskCatalog
+
+# app は他のテストがシートを差し替えたあとで読み込む（setUpClass）
+app = None
+
+SUBJECT = "特別支援教育基礎論"
+TASKS = [
+    {"subject": SUBJECT, "title": f"第{lesson}回(映像授業)", "deadline": f"2025/07/{lesson:02d}", "estimated_time_hours": "1"}
+    for lesson in (1, 10, 11)
+]
+
+
+class FakeMirror:
+    """達成記録の行から app と同じインデックスを作るだけのミラー"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def index_keys(self, name):
+        key_func = app._completion_key if name == app.COMPLETION_INDEX else app._completed_task_key
+        return {key_func(row) for row in self.rows}
+
+
+class LegacyCompletedKeysTest(unittest.TestCase):
+    """修正前の正規化（「第10回」→「第1回」）で記録された達成も達成済みになること"""
+
+    @classmethod
+    def setUpClass(cls):
+        global app
+        import app
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.workdir.name, "tasks.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(TASKS, f, ensure_ascii=False)
+        self.catalog = TaskCatalog(path=path)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def completed(self, titles, legacy_keys_before=""):
+        rows = [{"Date": date, "Subject": SUBJECT, "Title": title, "UserId": "U1"} for date, title in titles]
+        with mock.patch.object(app, "get_completion_mirror", return_value=FakeMirror(rows)), \
+                mock.patch.object(app, "get_catalog", return_value=self.catalog), \
+                mock.patch.object(app, "LEGACY_KEYS_BEFORE", legacy_keys_before):
+            return {title for _, title in app._completed_keys("U1")}
+
+    def test_single_legacy_row_is_the_first_lesson(self):
+        self.assertEqual(self.completed([("2025-06-01", "第1回(映像授業)")]), {"第1回(映像授業)"})
+
+    def test_two_legacy_rows_complete_the_tenth_lesson(self):
+        # 旧キーでは第10回の記録も「第1回」、第11回は「第11回」のまま
+        titles = [("2025-06-01", "第1回(映像授業)"), ("2025-06-08", "第1回(映像授業)"), ("2025-06-09", "第11回(映像授業)")]
+        self.assertEqual(self.completed(titles), {"第1回(映像授業)", "第10回(映像授業)", "第11回(映像授業)"})
+
+    def test_rows_after_the_fix_are_not_legacy(self):
+        titles = [("2025-06-01", "第1回(映像授業)"), ("2025-06-08", "第1回(映像授業)")]
+        self.assertEqual(self.completed(titles, legacy_keys_before="2025-06-05"), {"第1回(映像授業)"})
+        self.assertEqual(self.completed(titles, legacy_keys_before="off"), {"第1回(映像授業)"})
+
+    def test_current_key_rows_do_not_consume_legacy_rows(self):
+        titles = [("2025-06-01", "第1回(映像授業)"), ("2025-06-08", "第10回(映像授業)")]
+        self.assertEqual(self.completed(titles), {"第1回(映像授業)", "第10回(映像授業)"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linebot.models import TextSendMessage
+from line_client import create_line_bot_api
+from push_scheduler import PushLedger, PushScheduler
+
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        self.server.requests.append((self.path, self.headers.get("X-Line-Retry-Key"), body))
+        status, headers = self.server.respond(self.path)
+        payload = b"{}" if status == 200 else json.dumps({"message": "error"}).encode("utf-8")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class LineClientRetryKeyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _RecordingHandler)
+        self.server.requests = []
+        self.server.respond = lambda path: (200, {})
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api = create_line_bot_api("token")
+        self.api.endpoint = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reply_after_push_has_no_retry_key(self):
+        self.api.push_message("U1", TextSendMessage(text="push"), retry_key="key-1")
+        self.api.reply_message("reply-token", TextSendMessage(text="reply"))
+        self.api.push_message("U1", TextSendMessage(text="fallback"))
+
+        keys = [(path, key) for path, key, _ in self.server.requests]
+        self.assertEqual(keys, [
+            ("/v2/bot/message/push", "key-1"),
+            ("/v2/bot/message/reply", None),
+            ("/v2/bot/message/push", None),
+        ])
+        self.assertNotIn("X-Line-Retry-Key", self.api.headers)
+
+    def test_concurrent_pushes_send_their_own_key(self):
+        def push(i):
+            self.api.push_message(f"U{i}", TextSendMessage(text=f"message {i}"), retry_key=f"key-{i}")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(push, range(200)))
+
+        for _, key, body in self.server.requests:
+            self.assertEqual(key, f"key-{body['to'][1:]}")
+
+    def test_conflict_without_accepted_request_is_not_delivered(self):
+        self.server.respond = lambda path: (409, {})
+        with tempfile.TemporaryDirectory() as workdir:
+            ledger = PushLedger(path=os.path.join(workdir, "ledger.json"))
+            scheduler = PushScheduler(self.api, ledger=ledger)
+
+            result = scheduler.send({"U1": "hello"}, send_key="test")
+            self.assertEqual(result["failed"], 1)
+            self.assertEqual(ledger.delivered("test"), set())
+
+            self.server.respond = lambda path: (409, {"X-Line-Accepted-Request-Id": "accepted"})
+            result = scheduler.send({"U1": "hello"}, send_key="test")
+            self.assertEqual(result["sent"], 1)
+            self.assertEqual(ledger.delivered("test"), {"U1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from push_scheduler import PushLedger
+from user_registry import UserRegistry
+
+
+class SharedFileTest(unittest.TestCase):
+    """同じファイルを使う別プロセス（別インスタンス）の更新が互いに見えること"""
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_ledgers_see_and_keep_each_others_deliveries(self):
+        path = os.path.join(self.workdir.name, "push_ledger.json")
+        a, b = PushLedger(path=path), PushLedger(path=path)
+        self.assertEqual(b.delivered("daily_quests:2025-06-01"), set())
+
+        a.mark("daily_quests:2025-06-01", ["U1"])
+        self.assertEqual(b.delivered("daily_quests:2025-06-01"), {"U1"})
+
+        b.mark("review_reminder:2025-06-01", ["U2"])
+        self.assertEqual(a.delivered("daily_quests:2025-06-01"), {"U1"})
+        self.assertEqual(a.delivered("review_reminder:2025-06-01"), {"U2"})
+
+    def test_registries_keep_each_others_follows(self):
+        path = os.path.join(self.workdir.name, "users.json")
+        a, b = UserRegistry(path=path), UserRegistry(path=path)
+        a.add("U1")
+        b.add("U2")
+        a.add("U3")
+        self.assertTrue({"U1", "U2", "U3"} <= set(UserRegistry(path=path).active_users()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fakes import install_fake_sheets
+
+sheets = install_fake_sheets()
+
+import sheet_mirror
+from sheet_mirror import SheetMirror
+
+
+class SheetMirrorSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sheet = sheets["達成記録"]
+        self.sheet.append_row(["2025-06-01", "福祉心理学", "第1回(映像授業)", "", "U1"])
+        self.mirror = SheetMirror("達成記録", ttl=0)
+
+    def tearDown(self):
+        del self.sheet._rows[1:]
+
+    def test_empty_sync_then_external_append(self):
+        self.assertEqual(len(self.mirror.get_all_records()), 1)
+        # 新しい行のない同期を繰り返してもカーソルは進まない
+        self.mirror.refresh()
+        self.mirror.refresh()
+
+        self.sheet.append_row(["2025-06-02", "福祉心理学", "第2回(映像授業)", "", "U2"])
+        self.sheet.append_row(["2025-06-03", "福祉心理学", "第3回(映像授業)", "", "U2"])
+
+        titles = [record["Title"] for record in self.mirror.get_all_records()]
+        self.assertEqual(titles, ["第1回(映像授業)", "第2回(映像授業)", "第3回(映像授業)"])
+
+    def test_blank_row_in_the_middle_is_counted(self):
+        self.mirror.refresh()
+        self.sheet.append_row(["", "", "", "", ""])
+        self.sheet.append_row(["2025-06-02", "福祉心理学", "第2回(映像授業)", "", "U2"])
+        self.mirror.refresh()
+        self.sheet.append_row(["2025-06-03", "福祉心理学", "第3回(映像授業)", "", "U2"])
+
+        titles = [record["Title"] for record in self.mirror.get_all_records()]
+        self.assertEqual(titles, ["第1回(映像授業)", "第2回(映像授業)", "第3回(映像授業)"])
+
+
+class SheetMirrorHeaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sheet = sheets["復習記録"]
+        self.header = self.sheet._rows[0]
+
+    def tearDown(self):
+        self.sheet._rows[:] = [self.header]
+
+    def test_missing_user_id_header_keeps_the_user_id(self):
+        # UserId のヘッダーがない既存のシート
+        self.sheet._rows[:] = [self.header[:-1], ["2025-06-01", "福祉心理学", "第1回(映像授業)", "1", "", "U1"]]
+        mirror = SheetMirror("復習記録")
+
+        records = mirror.get_all_records()
+        self.assertEqual(records[0]["UserId"], "U1")
+
+
+if __name__ == "__main__":
+    unittest.main()
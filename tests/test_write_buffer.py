@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_buffer import SheetWriteBuffer
+
+
+def _replay_worker(journal_path, barrier, done, results):
+    buffer = SheetWriteBuffer(journal_path=journal_path)
+    barrier.wait()
+    results.put([entry["row"][0] for entry in buffer._pending] if buffer.replay() else [])
+    # 引き継いだプロセスが生きている間に、もう一方が replay する
+    done.wait()
+
+
+class WriteBufferReplayTest(unittest.TestCase):
+
+    def test_concurrent_workers_take_over_each_row_once(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            journal_path = os.path.join(workdir, "done_log.json")
+            # 終了したプロセスが残した未書き込みの行
+            crashed = multiprocessing.get_context("fork").Process(target=lambda: None)
+            crashed.start()
+            crashed.join()
+            with open(journal_path, "w", encoding="utf-8") as f:
+                f.write("{}\n")
+                f.write(json.dumps({"id": "row1", "pid": crashed.pid, "sheet": "達成記録", "row": ["row1"]}) + "\n")
+
+            context = multiprocessing.get_context("fork")
+            barrier, done, results = context.Barrier(2), context.Event(), context.Queue()
+            workers = [context.Process(target=_replay_worker, args=(journal_path, barrier, done, results))
+                       for _ in range(2)]
+            for worker in workers:
+                worker.start()
+            replayed = [results.get(timeout=10) for _ in workers]
+            done.set()
+            for worker in workers:
+                worker.join()
+
+            self.assertEqual(sorted(replayed), [[], ["row1"]])
+            with open(journal_path, "r", encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip() and line.strip() != "{}"]
+            self.assertEqual([row["id"] for row in rows], ["row1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+# 正規化結果を覚えておく件数（科目名・タイトルは種類が限られる）
+NORMALIZE_CACHE_SIZE = int(os.getenv("NORMALIZE_CACHE_SIZE", "4096"))
+
+# ゼロ幅文字・異体字セレクタ（絵文字用の U+FE0F を含む）
+ZERO_WIDTH_CHARS = [0x200B, 0x200C, 0x200D, 0x2060, 0xFEFF] + list(range(0xFE00, 0xFE10))
+# 制御文字
+CONTROL_CHARS = list(range(0x00, 0x20)) + [0x7F]
+# 空白文字（re の \s と同じ集合。U+3000 より後には存在しない）
+WHITESPACE_CHARS = [i for i in range(0x3001) if chr(i).isspace()]
+
+# 削除する文字の変換テーブル
+_STRIP_TABLE = dict.fromkeys(ZERO_WIDTH_CHARS + CONTROL_CHARS + WHITESPACE_CHARS)
+_CONTROL_TABLE = dict.fromkeys(CONTROL_CHARS)
+
+_EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F300-\U0001F64F" # 顔文字・自然・手など
+    "\U0001F680-\U0001F6FF"  # 乗り物・地図記号
+    "\u2600-\u26FF"          # その他の記号
+    "\u2700-\u27BF"          # その他の記号
+    "\uFE0F"                 # 絵文字用バリアントセレクタ
+    "]+", flags=re.UNICODE
+)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_cached(text):
+    # ASCIIのみならNFKCは不要
+    if not text.isascii():
+        text = unicodedata.normalize("NFKC", text)
+    return text.translate(_STRIP_TABLE)
+
+# 文字列の正規化
+def normalize(text):
+    """NFKC正規化のうえ、ゼロ幅文字・制御文字・空白を除去"""
+    if not text:
+        return ''
+    if not isinstance(text, str):
+        text = str(text)
+    return _normalize_cached(text)
+
+# 修正前の normalize は文字クラスの書き間違い（[...\uFEFFuFE0F]）で u・F・E・0 も消していた。
+# その頃に記録された達成記録のキーと照合する移行期間だけ使う
+_LEGACY_STRIP_TABLE = dict.fromkeys(map(ord, "uFE0"))
+
+def legacy_normalize(text):
+    """修正前の normalize と同じキー（「第10回」→「第1回」など）"""
+    return normalize(text).translate(_LEGACY_STRIP_TABLE)
+
+# 制御文字を除去
+def clean_text(text):
+    return text.translate(_CONTROL_TABLE).strip()
+
+# 絵文字を除去
+def remove_emojis(text):
+    return _EMOJI_PATTERN.sub("", text).strip()
+
+def cache_info():
+    return _normalize_cached.cache_info()
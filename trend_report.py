@@ -0,0 +1,118 @@
+import re
+from datetime import date, timedelta
+from daily_rollup import ensure_rollups, get_rollup_store
+from emotion_series import correlation, get_emotion_series, rolling_average
+from text_normalizer import normalize
+from library import get_jst_date, DEFAULT_USER_ID
+
+# 傾向レポートで指定できる最長の期間（日）
+MAX_TREND_DAYS = 366
+ROLLING_WINDOW_DAYS = 7
+
+
+def get_month_range(today=None):
+    """今月の1日〜今日"""
+    today = today or date.fromisoformat(get_jst_date())
+    return today.replace(day=1), today
+
+def parse_trend_range(text, today=None):
+    """「30」（直近30日）または「2025-06-01〜2025-06-30」を (開始日, 終了日) に変換"""
+    today = today or date.fromisoformat(get_jst_date())
+    text = normalize(text)
+    if text.isdigit():
+        days = int(text)
+        if not 1 <= days <= MAX_TREND_DAYS:
+            raise ValueError("days out of range")
+        return today - timedelta(days=days - 1), today
+
+    dates = re.findall(r"\d{4}[-/]\d{1,2}[-/]\d{1,2}", text)
+    if len(dates) != 2:
+        raise ValueError("expected two dates")
+    start, end = (date(*(int(part) for part in re.split(r"[-/]", value))) for value in dates)
+    if end < start:
+        start, end = end, start
+    if (end - start).days + 1 > MAX_TREND_DAYS:
+        raise ValueError("range too long")
+    return start, end
+
+
+def build_trend(start, end, user_id=DEFAULT_USER_ID):
+    """期間の日別の集中度・達成数と、移動平均・絵文字の分布"""
+    series = get_emotion_series()
+    focus = series.daily_focus(start, end, user_id)
+    ensure_rollups()
+    completions = [day["completions"] for _, day in get_rollup_store().get_days(start, end, user_id)]
+    emojis = series.emoji_distribution(start, end, user_id)
+
+    recorded = [value for value in focus if value is not None]
+    active = [value for value, count in zip(focus, completions) if value is not None and count > 0]
+    inactive = [value for value, count in zip(focus, completions) if value is not None and count == 0]
+    return {
+        "start": start,
+        "end": end,
+        "focus": focus,
+        "completions": completions,
+        "rolling_focus": rolling_average(focus, ROLLING_WINDOW_DAYS),
+        "average_focus": round(sum(recorded) / len(recorded)) if recorded else None,
+        "focus_on_active_days": round(sum(active) / len(active)) if active else None,
+        "focus_on_rest_days": round(sum(inactive) / len(inactive)) if inactive else None,
+        "focus_completion_correlation": correlation(focus, completions),
+        "emojis": emojis,
+    }
+
+def _format_percent(value):
+    return "—" if value is None else f"{value:g}%"
+
+def create_trend_message(title, trend):
+    start, end = trend["start"], trend["end"]
+    message = f"📈 【{title}】{start.strftime('%Y/%m/%d')}〜{end.strftime('%Y/%m/%d')}\n\n"
+
+    message += (
+        f"🎯 達成数：{sum(trend['completions'])}件"
+        f"（{sum(1 for count in trend['completions'] if count)}日間）\n"
+        f"🧠 平均集中度：{_format_percent(trend['average_focus'])}\n"
+    )
+
+    # 移動平均は最初と最後の値で変化を見る
+    rolling = [value for value in trend["rolling_focus"] if value is not None]
+    if len(rolling) >= 2:
+        change = rolling[-1] - rolling[0]
+        arrow = "↗️" if change > 0 else "↘️" if change < 0 else "➡️"
+        message += f"{arrow} 集中度（{ROLLING_WINDOW_DAYS}日移動平均）：{rolling[0]:g}% → {rolling[-1]:g}%\n"
+
+    message += (
+        f"\n📊 集中度と達成数\n"
+        f"達成した日：{_format_percent(trend['focus_on_active_days'])}"
+        f" ／ 達成のない日：{_format_percent(trend['focus_on_rest_days'])}\n"
+    )
+    if trend["focus_completion_correlation"] is not None:
+        message += f"相関係数：{trend['focus_completion_correlation']:.2f}\n"
+
+    # 期間を週ごとに区切った集中度・達成数
+    message += "\n🗓️ 週ごとの推移\n"
+    for offset in range(0, len(trend["focus"]), 7):
+        week_focus = [value for value in trend["focus"][offset:offset + 7] if value is not None]
+        week_start = start + timedelta(days=offset)
+        week_end = min(week_start + timedelta(days=6), end)
+        average = round(sum(week_focus) / len(week_focus)) if week_focus else None
+        message += (
+            f"{week_start.month}/{week_start.day}〜{week_end.month}/{week_end.day}："
+            f"集中度{_format_percent(average)} 達成{sum(trend['completions'][offset:offset + 7])}件\n"
+        )
+
+    emojis = trend["emojis"]
+    if emojis:
+        total = sum(emojis.values())
+        distribution = "　".join(f"{emoji}{round(count / total * 100)}%" for emoji, count in emojis.most_common(5))
+        message += f"\n😊 気分の分布：{distribution}"
+    else:
+        message += "\n😊 気分の記録はありません"
+    return message
+
+def build_monthly_trend_message(user_id=DEFAULT_USER_ID):
+    start, end = get_month_range()
+    return create_trend_message("今月の振り返り", build_trend(start, end, user_id))
+
+def build_range_trend_message(range_text, user_id=DEFAULT_USER_ID):
+    start, end = parse_trend_range(range_text)
+    return create_trend_message("期間の振り返り", build_trend(start, end, user_id))
@@ -0,0 +1,86 @@
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+from library import DEFAULT_USER_ID, get_jst_time
+
+USER_REGISTRY_PATH = os.getenv("USER_REGISTRY_PATH", "users.json")
+
+
+class UserRegistry:
+    """Push配信先のユーザー一覧（友だち追加・ブロックのイベントで更新）
+
+    複数のワーカーから更新されるため、更新はファイルロックを取って最新の内容を
+    読み直してから行う（同時の友だち追加で登録が消えないように）。
+    """
+
+    def __init__(self, path=USER_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._users = {}
+        self._mtime = None
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._users = {}
+            self._mtime = None
+            return
+        if mtime != self._mtime:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._users = json.load(f)
+            self._mtime = mtime
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._users, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    @contextmanager
+    def _update(self):
+        with self._lock, open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # 更新時刻の粒度で取りこぼさないよう、ロック内では必ず読み直す
+                self._mtime = None
+                self._reload_if_changed()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add(self, user_id):
+        with self._update():
+            user = self._users.setdefault(user_id, {"followed_at": get_jst_time()})
+            user["active"] = True
+            self._save()
+
+    def remove(self, user_id):
+        with self._update():
+            if user_id in self._users:
+                self._users[user_id]["active"] = False
+                self._save()
+
+    def is_registered(self, user_id):
+        with self._lock:
+            self._reload_if_changed()
+            return user_id in self._users
+
+    def active_users(self):
+        """配信対象のユーザーID（既定のユーザーを含む）"""
+        with self._lock:
+            self._reload_if_changed()
+            users = [user_id for user_id, user in self._users.items() if user.get("active", True)]
+            if DEFAULT_USER_ID not in self._users:
+                users.insert(0, DEFAULT_USER_ID)
+        return users
+
+
+_registry = UserRegistry()
+
+
+def get_user_registry():
+    return _registry
@@ -0,0 +1,151 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ワーカースレッド数・キューの上限・満杯時に待つ秒数
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "100"))
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv("WEBHOOK_ENQUEUE_TIMEOUT", "0.5"))
+
+
+def event_partition_key(event):
+    """同じ送信元（ユーザー・グループ・トーク）のイベントは同じ順序で処理する"""
+    source = getattr(event, "source", None)
+    for name in ("user_id", "group_id", "room_id"):
+        value = getattr(source, name, None)
+        if value:
+            return value
+    return ""
+
+
+class EventWorkerPool:
+    """Webhookイベントを処理する上限付きのワーカープール
+
+    ワーカーごとにキューを持ち、イベントは送信元ごとに同じワーカーへ振り分ける
+    （同じユーザーのイベントは届いた順に、別のユーザーのイベントは並行して処理される）。
+    キューが満杯のときは enqueue_timeout 秒だけ待ち、それでも空かなければ
+    submit が False を返す（呼び出し側がその場で処理することで流入を抑える）。
+    """
+
+    def __init__(self, handle_func, size=WEBHOOK_WORKERS, max_queue=WEBHOOK_QUEUE_SIZE,
+                 enqueue_timeout=WEBHOOK_ENQUEUE_TIMEOUT, key_func=event_partition_key):
+        self.handle_func = handle_func
+        self.size = size
+        self.enqueue_timeout = enqueue_timeout
+        self.key_func = key_func
+        self._queues = [queue.Queue(maxsize=max(max_queue // size, 1)) for _ in range(size)]
+        self._lock = threading.Lock()
+        self._threads = []
+        self._batch_executor = None
+        self._stats = {
+            "submitted": 0,
+            "rejected": 0,
+            "processed": 0,
+            "failed": 0,
+            "max_queue_depth": 0,
+            "total_wait_ms": 0.0,
+            "total_processing_ms": 0.0,
+            "max_processing_ms": 0.0,
+        }
+
+    def _ensure_started(self):
+        # gunicornのfork後に各ワーカープロセスでスレッドを起動する
+        with self._lock:
+            if self._threads:
+                return
+            for i, worker_queue in enumerate(self._queues):
+                thread = threading.Thread(target=self._run, args=(worker_queue,), name=f"webhook-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _queue_for(self, event):
+        return self._queues[hash(self.key_func(event)) % self.size]
+
+    def submit(self, event):
+        self._ensure_started()
+        worker_queue = self._queue_for(event)
+        try:
+            worker_queue.put((event, time.monotonic()), timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            print("⚠️ Webhookキューが満杯です")
+            return False
+
+        with self._lock:
+            self._stats["submitted"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self.queue_depth())
+        return True
+
+    def process_batch(self, events):
+        """1つのWebhookに含まれるイベントをこのリクエスト内で処理する
+
+        送信元ごとにまとめ、同じ送信元のイベントは順番に、別の送信元のイベントは並行して処理する。
+        """
+        groups = {}
+        for event in events:
+            groups.setdefault(self.key_func(event), []).append(event)
+
+        def run_group(group):
+            for event in group:
+                started = time.monotonic()
+                failed = False
+                try:
+                    self.handle_func(event)
+                except Exception as e:
+                    failed = True
+                    print(f"❌️ Webhookイベントの処理に失敗: {e}")
+                finally:
+                    self._record(0.0, time.monotonic() - started, failed)
+
+        if len(groups) <= 1:
+            for group in groups.values():
+                run_group(group)
+            return
+
+        with self._lock:
+            if self._batch_executor is None:
+                self._batch_executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="webhook-batch")
+            executor = self._batch_executor
+        for future in [executor.submit(run_group, group) for group in groups.values()]:
+            future.result()
+
+    def queue_depth(self):
+        return sum(worker_queue.qsize() for worker_queue in self._queues)
+
+    def _run(self, worker_queue):
+        while True:
+            event, enqueued_at = worker_queue.get()
+            started = time.monotonic()
+            failed = False
+            try:
+                self.handle_func(event)
+            except Exception as e:
+                failed = True
+                print(f"❌️ Webhookイベントの処理に失敗: {e}")
+            finally:
+                finished = time.monotonic()
+                self._record(started - enqueued_at, finished - started, failed)
+                worker_queue.task_done()
+
+    def _record(self, wait, elapsed, failed):
+        with self._lock:
+            self._stats["processed"] += 1
+            if failed:
+                self._stats["failed"] += 1
+            self._stats["total_wait_ms"] += wait * 1000
+            self._stats["total_processing_ms"] += elapsed * 1000
+            self._stats["max_processing_ms"] = max(self._stats["max_processing_ms"], elapsed * 1000)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        processed = stats["processed"]
+        stats["workers"] = self.size
+        stats["queue_depth"] = self.queue_depth()
+        stats["queue_capacity"] = sum(worker_queue.maxsize for worker_queue in self._queues)
+        stats["avg_wait_ms"] = round(stats["total_wait_ms"] / processed, 2) if processed else 0.0
+        stats["avg_processing_ms"] = round(stats["total_processing_ms"] / processed, 2) if processed else 0.0
+        return stats
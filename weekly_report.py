@@ -1,12 +1,9 @@
 from collections import Counter
 from datetime import datetime, timedelta
-from google_sheets_util import get_sheet, get_emotion_sheet, append_row_to_sheet
-from openai import OpenAI
-from zoneinfo import ZoneInfo
-from library import get_jst_date
-
-client = OpenAI()
-import os
+from daily_rollup import ensure_rollups, get_rollup_store
+from write_buffer import buffered_append_row, buffered_append_rows
+from library import get_jst_date, DEFAULT_USER_ID
+from summary_comment import get_comment_service
 
 def get_week_range():
     """今週の月曜〜日曜の日付範囲を取得"""
@@ -17,43 +14,29 @@ def get_week_range():
     end = start + timedelta(days=6) # 日曜日
     return start.date(), end.date()
 
-def fetch_weekly_summary():
+def fetch_weekly_summary(user_id=DEFAULT_USER_ID):
     start_date, end_date = get_week_range()
-    sheet = get_sheet()
-    emotion_sheet = get_emotion_sheet()
+    ensure_rollups()
 
-    # 達成記録の取得
-    records = sheet.get_all_records()
-    weekly_tasks = [
-        row for row in records
-        if start_date <= datetime.strptime(row["Date"], "%Y-%m-%d").date() <= end_date
-    ]
-    actual_count = len(weekly_tasks)
+    # 今週の日別集計（7日分）
+    days = [day for _, day in get_rollup_store().get_days(start_date, end_date, user_id)]
 
-    # 実活動日数
-    days_with_tasks = set(row["Date"] for row in weekly_tasks)
-    ideal_count = len(days_with_tasks) * 3 # 1日3件が理想
+    # 達成記録
+    actual_count = sum(day["completions"] for day in days)
 
-    # 感情ログの取得
-    emotion_records = emotion_sheet.get_all_records()
-    weekly_emotions = [
-        row for row in emotion_records
-        if start_date <= datetime.strptime(row["today"], "%Y-%m-%d").date()
-    ]
+    # 実活動日数
+    days_with_tasks = sum(1 for day in days if day["completions"] > 0)
+    ideal_count = days_with_tasks * 3 # 1日3件が理想
 
     # 平均集中度・感情傾向
-    focus_values = []
-    emojis = []
-    for row in weekly_emotions:
-        try:
-            focus = int(row["集中度"].replace("%", "").strip())
-            focus_values.append(focus)
-            emojis.append(row["感情"])
-        except:
-            continue
+    focus_sum = sum(day["focus_sum"] for day in days)
+    focus_count = sum(day["focus_count"] for day in days)
+    emojis = Counter()
+    for day in days:
+        emojis.update(day["emojis"])
 
-    avg_focus = round(sum(focus_values) / len(focus_values)) if focus_values else 0
-    top_emoji = Counter(emojis).most_common(1)[0][0] if emojis else "😐"
+    avg_focus = round(focus_sum / focus_count) if focus_count else 0
+    top_emoji = emojis.most_common(1)[0][0] if emojis else "😐"
 
     # 結果を辞書で返す
     return {
@@ -66,27 +49,14 @@ def fetch_weekly_summary():
     }
 
 def generate_summary_comment(summary_data):
-    prompt = (
-        f"以下は、ある学生の1週間の学習活動のサマリーです：\n"
-        f"- 週の期間：{summary_data['週']}\n"
-        f"- 理想達成数：{summary_data['理想達成数']}件\n"
-        f"- 実達成数：{summary_data['実達成数']}件\n"
-        f"- 達成率：{summary_data['達成率']}\n"
-        f"- 平均集中度：{summary_data['平均集中度']}\n"
-        f"- 感情傾向：{summary_data['感情傾向']}\n\n"
-        f"このデータをもとに、学生に向けてポジティブで具体的な振り返りコメントを100文字以内で書いてください。"
-    )
-
-    response = client.chat.completions.create(
-        model = "gpt-4o",
-        messages = [
-            {"role": "system", "content": "あなたは学習支援アシスタントです。。"},
-            {"role": "user", "content": prompt}
-        ]
-    )
+    """総括コメント（キャッシュ済みならそれを使い、時間切れなら定型文）"""
+    return get_comment_service().get_comment(summary_data)
 
-    print(response.choices[0].message.content)
-    return response.choices[0].message.content.strip()
+def precompute_summary_comment(user_id=DEFAULT_USER_ID):
+    """定時Pushの前に今週のコメント生成を始めておく"""
+    summary = fetch_weekly_summary(user_id)
+    get_comment_service().precompute(summary)
+    return summary
 
 def create_weekly_report_message(summary_data, summary_comment):
     message = (
@@ -101,15 +71,23 @@ def create_weekly_report_message(summary_data, summary_comment):
     )
     return message
 
-def record_weekly_report(summary_data, comment):
-    row = [
+def weekly_report_row(summary_data, comment, user_id=DEFAULT_USER_ID):
+    return [
         summary_data.get('週'),
         summary_data.get('理想達成数'),
         summary_data.get('実達成数'),
         summary_data.get('達成率'),
         summary_data.get('平均集中度'),
         summary_data.get('感情傾向'),
-        comment
+        comment,
+        user_id
     ]
+
+def record_weekly_report(summary_data, comment, user_id=DEFAULT_USER_ID):
     print(summary_data)
-    append_row_to_sheet('週次レポート', row)
\ No newline at end of file
+    buffered_append_row('週次レポート', weekly_report_row(summary_data, comment, user_id))
+
+def record_weekly_reports(reports):
+    """全ユーザーの週次レポート（{ユーザーID: (サマリー, コメント, メッセージ)}）を1回で追記"""
+    rows = [weekly_report_row(summary, comment, user_id) for user_id, (summary, comment, _) in reports.items()]
+    buffered_append_rows('週次レポート', rows)
\ No newline at end of file
@@ -0,0 +1,239 @@
+import os
+import json
+import uuid
+import fcntl
+import atexit
+import threading
+from storage import get_sheet
+
+# 1にするとSheetsへの追記をジャーナル経由でまとめて書き込む
+WRITE_BUFFER_ENABLED = os.getenv("SHEETS_WRITE_BUFFER", "0") == "1"
+# 追記前に記録するジャーナル（JSON Lines。1行目の {} は空のヘッダー扱い）
+JOURNAL_PATH = os.getenv("WRITE_JOURNAL_PATH", "done_log.json")
+# この件数たまるか、この秒数が経過したらSheetsへ書き込む
+FLUSH_BATCH_SIZE = int(os.getenv("WRITE_FLUSH_BATCH_SIZE", "20"))
+FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "5"))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SheetWriteBuffer:
+    """ジャーナル付きのSheets書き込みバッファ
+
+    行はまずローカルのジャーナルに追記してから受け付け、ワークシートごとに
+    append_rows でまとめて書き込む。書き込み済みのIDもジャーナルに記録し、
+    起動時には終了したプロセスが残した未書き込みの行を再送する。
+    """
+
+    def __init__(self, journal_path=JOURNAL_PATH, batch_size=FLUSH_BATCH_SIZE, interval=FLUSH_INTERVAL):
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # 未書き込みのエントリ（受け付け順）
+        self._pending = []
+        self._thread = None
+
+    # --- ジャーナル ---
+
+    def _write_journal(self, entries):
+        with open(self.journal_path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # 末尾が改行で終わっていなければ行を区切る
+                size = f.seek(0, os.SEEK_END)
+                if size > 0:
+                    f.seek(size - 1)
+                    if f.read(1) != "\n":
+                        f.write("\n")
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_unflushed(self, f):
+        # 引き継がれた行は同じIDで記録し直されるので、後の記録（現在の持ち主）を使う
+        entries = {}
+        flushed = set()
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ ジャーナルの壊れた行をスキップ: {line[:80]}")
+                continue
+            if "flushed" in record:
+                flushed.update(record["flushed"])
+            elif "id" in record:
+                entries[record["id"]] = record
+        return [entry for entry_id, entry in entries.items() if entry_id not in flushed]
+
+    def _rewrite(self, f, entries):
+        # ロックを取ったジャーナルを entries だけに書き直す
+        f.seek(0)
+        f.truncate()
+        f.write("{}\n")
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _compact(self):
+        # 書き込み済みの行を取り除いてジャーナルを作り直す
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._rewrite(f, self._read_unflushed(f))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def replay(self):
+        """終了済みプロセスが残した未書き込みの行をバッファに戻す"""
+        if not os.path.exists(self.journal_path):
+            return 0
+        # 同時に起動した他のワーカーと同じ行を引き継がないよう、読み込み・引き継ぎ・
+        # 書き直しを1つの排他ロックの中で行う
+        with open(self.journal_path, "r+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                entries = self._read_unflushed(f)
+                with self._lock:
+                    own_ids = {entry["id"] for entry in self._pending}
+                orphaned = [
+                    entry for entry in entries
+                    if entry["id"] not in own_ids
+                    and (entry.get("pid") == os.getpid() or not _pid_alive(entry.get("pid", 0)))
+                ]
+                if orphaned:
+                    # 引き継いだ行は自分のプロセスのものとして書き直す（他のプロセスは読み飛ばす）
+                    for entry in orphaned:
+                        entry["pid"] = os.getpid()
+                    self._rewrite(f, entries)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        if orphaned:
+            with self._lock:
+                self._pending = orphaned + self._pending
+            print(f"♻️ ジャーナルから未書き込みの{len(orphaned)}行を復元しました")
+        return len(orphaned)
+
+    # --- バッファ ---
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="sheets-write-buffer", daemon=True)
+            self._thread.start()
+        self.replay()
+        atexit.register(self.flush)
+
+    def append_row(self, sheet_name, row_values):
+        """行をジャーナルに記録して受け付ける（Sheetsへの書き込みは後で行う）"""
+        self.append_rows(sheet_name, [row_values])
+
+    def append_rows(self, sheet_name, rows):
+        self.start()
+        entries = [{"id": uuid.uuid4().hex, "pid": os.getpid(), "sheet": sheet_name, "row": list(row_values)}
+                   for row_values in rows]
+        self._write_journal(entries)
+        with self._lock:
+            self._pending.extend(entries)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def pending_rows(self, sheet_name):
+        with self._lock:
+            return [entry["row"] for entry in self._pending if entry["sheet"] == sheet_name]
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """未書き込みの行をワークシートごとに append_rows で書き込む"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending)
+            if not batch:
+                return 0
+
+            by_sheet = {}
+            for entry in batch:
+                by_sheet.setdefault(entry["sheet"], []).append(entry)
+
+            written = 0
+            for sheet_name, entries in by_sheet.items():
+                try:
+                    get_sheet(sheet_name).append_rows([entry["row"] for entry in entries])
+                except Exception as e:
+                    # 失敗した行はバッファに残し、次回に再送する
+                    print(f"❌️ {sheet_name} への一括書き込みに失敗: {e}")
+                    continue
+
+                ids = [entry["id"] for entry in entries]
+                self._write_journal([{"flushed": ids}])
+                flushed_ids = set(ids)
+                with self._lock:
+                    self._pending = [entry for entry in self._pending if entry["id"] not in flushed_ids]
+                written += len(entries)
+
+            if written:
+                self._compact()
+                print(f"✅️ Sheetsへ{written}行を書き込みました")
+            return written
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌️ 書き込みバッファのフラッシュ中にエラー: {e}")
+
+
+_buffer = SheetWriteBuffer()
+
+
+def get_write_buffer():
+    return _buffer
+
+# Sheetsへの追記（バッファ有効時はジャーナル経由で遅延書き込み）
+def buffered_append_row(sheet_name, row_values):
+    if WRITE_BUFFER_ENABLED:
+        _buffer.append_row(sheet_name, row_values)
+    else:
+        get_sheet(sheet_name).append_row(row_values)
+
+# 複数行の追記（バッファ無効時も1回の append_rows で書き込む）
+def buffered_append_rows(sheet_name, rows):
+    if not rows:
+        return
+    if WRITE_BUFFER_ENABLED:
+        _buffer.append_rows(sheet_name, rows)
+    else:
+        get_sheet(sheet_name).append_rows(rows)
+
+def pending_rows(sheet_name):
+    if not WRITE_BUFFER_ENABLED:
+        return []
+    return _buffer.pending_rows(sheet_name)